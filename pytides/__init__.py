@@ -4,4 +4,14 @@ import tide
 import astro
 import constituent
 import nodal_corrections
-
+import collection
+import nodal_table
+import prepared
+import partition
+import bulk
+import design
+import running
+import online
+import instrument
+import store
+import extrema_index
@@ -1,4 +1,5 @@
 from collections import namedtuple
+from datetime import datetime
 import numpy as np
 d2r, r2d = np.pi/180.0, 180.0/np.pi
 
@@ -18,20 +19,37 @@ def s2d(degrees, arcmins = 0, arcsecs = 0, mas = 0, muas = 0):
 			+ (muas    / (60.0*60.0*1e6))
 	)
 
-#Evaluate a polynomial at argument
+#Evaluate a polynomial at argument (which may be an array) by Horner's method
 def polynomial(coefficients, argument):
-	return sum([c * (argument ** i) for i,c in enumerate(coefficients)])
+	result = 0.0 * argument
+	for c in reversed(coefficients):
+		result = result * argument + c
+	return result
 
 #Evaluate the first derivative of a polynomial at argument
 def d_polynomial(coefficients, argument):
-	return sum([c * i * (argument ** (i-1)) for i,c in enumerate(coefficients)])
+	return polynomial([c * i for i,c in enumerate(coefficients)][1:], argument)
 
 #Meeus formula 11.1
 def T(t):
 	return (JD(t) - 2451545.0)/36525
 
+#Julian date of the unix epoch, 1970-01-01T00:00:00
+unix_epoch_JD = 2440587.5
+
 #Meeus formula 7.1
+#Other than datetimes we also accept datetime64 values (converted directly),
+#arrays of datetimes (converted element by element) and numbers, which are
+#taken to be Julian dates already.
 def JD(t):
+	if not isinstance(t, datetime):
+		t = np.asarray(t)
+		if np.issubdtype(t.dtype, np.datetime64):
+			days = (t - np.datetime64('1970-01-01T00:00:00')) / np.timedelta64(1, 'D')
+			return (days + unix_epoch_JD)[()]
+		elif t.dtype == object:
+			return np.array([JD(t_i) for t_i in t.flat]).reshape(t.shape)
+		return t.astype(float)[()]
 	Y, M = t.year, t.month
 	D = (
 		t.day
@@ -155,7 +173,16 @@ def _nupp(N, i, omega):
 AstronomicalParameter = namedtuple('AstronomicalParameter', ['value', 'speed'])
 
 def astro(t):
+	"""
+	Return a dictionary of AstronomicalParameters at the given time(s).
+	Arguments:
+	t -- a datetime, or an array of datetime64 values or Julian dates; in the
+	     latter case each value and speed is an array with one entry per time.
+	"""
 	a = {}
+	#Evaluate the Julian date (and century) once, every polynomial needs them.
+	jd = JD(t)
+	centuries = T(jd)
 	#We can use polynomial fits from Meeus to obtain good approximations to
 	#some astronomical values (and therefore speeds).
 	polynomials = {
@@ -173,8 +200,8 @@ def astro(t):
 	dT_dHour = 1 / (24 * 365.25 * 100)
 	for name, coefficients in polynomials.items():
 		a[name] = AstronomicalParameter(
-				np.mod(polynomial(coefficients, T(t)), 360.0),
-				d_polynomial(coefficients, T(t)) * dT_dHour
+				np.mod(polynomial(coefficients, centuries), 360.0),
+				d_polynomial(coefficients, centuries) * dT_dHour
 		)
 
 	#Some other parameters defined by Schureman which are dependent on the
@@ -193,7 +220,7 @@ def astro(t):
 	#We don't work directly with the T (hours) parameter, instead our spanning
 	#set for equilibrium arguments #is given by T+h-s, s, h, p, N, pp, 90.
 	#This is in line with convention.
-	hour = AstronomicalParameter((JD(t) - np.floor(JD(t))) * 360.0, 15.0)
+	hour = AstronomicalParameter((jd - np.floor(jd)) * 360.0, 15.0)
 	a['T+h-s'] = AstronomicalParameter(
 		hour.value + a['h'].value - a['s'].value,
 		hour.speed + a['h'].speed - a['s'].speed
@@ -0,0 +1,212 @@
+"""
+Benchmarks of astro(), Tide._prepare(), Tide.at(), Tide.decompose() and
+Tide.extrema() on synthetic tides with every NOAA constituent, over periods
+of a day to 19 years sampled every minute to every hour.
+
+Each case runs in its own process (so that its peak memory can be measured)
+and reports its throughput in samples, extrema, fits or calls per second.
+Results are saved as JSON, and can be compared with those of another run to
+find regressions. Run from the command line with
+	python -m pytides.benchmarks --help
+
+imports() measures the cost of importing pytides in a fresh interpreter, which
+is paid by every short-lived process predicting from stored models, and checks
+it against import_budget.
+"""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import multiprocessing
+from datetime import datetime
+try:
+	from Queue import Empty
+except ImportError:
+	from queue import Empty
+import numpy as np
+
+from pytides.benchmarks.cases import cases
+
+def _rss():
+	#Current resident set size in bytes (Linux)
+	with open('/proc/self/statm') as fh:
+		return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def _measure(case, days, minutes, repeat, queue):
+	"""
+	Run one case (in a child process), putting (seconds, count, peak memory)
+	or an error message on the queue.
+	"""
+	try:
+		baseline = _rss()
+		function, count = case(days, minutes)
+		#The first run includes any one-off costs, so we keep the best
+		seconds = []
+		for _ in range(repeat):
+			start = time.time()
+			function()
+			seconds.append(time.time() - start)
+		peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - baseline
+		queue.put((min(seconds), count, max(peak, 0)))
+	except Exception as e:
+		queue.put('%s: %s' % (type(e).__name__, e))
+
+def _result(process, queue, timeout = None):
+	"""
+	Wait for the result of a case's process, or an error message if it exits
+	without one or runs for longer than timeout seconds.
+	"""
+	start = time.time()
+	while True:
+		try:
+			return queue.get(timeout = 1.0)
+		except Empty:
+			pass
+		if not process.is_alive():
+			#The result may have arrived as the process exited
+			try:
+				return queue.get(timeout = 1.0)
+			except Empty:
+				return 'process exited with code %s' % process.exitcode
+		if timeout is not None and time.time() - start > timeout:
+			process.terminate()
+			return 'timed out after %g s' % timeout
+
+def run(names = None, quick = False, repeat = 3, log = None, timeout = None):
+	"""
+	Run the benchmarks, returning their results as a dictionary.
+	Arguments:
+	names -- optional list of names (or prefixes of names, such as 'at') of the cases to run
+	quick -- whether to run only the smaller cases (default: False)
+	repeat -- number of times to time each case, keeping the fastest (default: 3)
+	log -- optional function called with a line of text as each case completes
+	timeout -- optional number of seconds after which a case is stopped and recorded as failed
+	A case whose process dies without a result (killed by the OOM killer, say)
+	is recorded as failed rather than waited for.
+	"""
+	results = {}
+	for name, case, unit, days, minutes, small in cases:
+		if quick and not small:
+			continue
+		if names and not any(name == n or name.startswith(n + '/') for n in names):
+			continue
+		queue = multiprocessing.Queue()
+		process = multiprocessing.Process(target = _measure, args = (case, days, minutes, repeat, queue))
+		process.start()
+		result = _result(process, queue, timeout)
+		process.join()
+		if isinstance(result, str):
+			results[name] = {'error': result}
+			line = '%-28s failed: %s' % (name, result)
+		else:
+			seconds, count, peak = result
+			results[name] = {
+				'unit': unit,
+				'count': count,
+				'seconds': seconds,
+				'throughput': count / seconds if seconds > 0 else float('inf'),
+				'peak_memory': peak
+			}
+			line = '%-28s %12.4g %s/s %10.4g s %8.1f MB' % (
+				name, results[name]['throughput'], unit, seconds, peak / 2.0**20
+			)
+		if log:
+			log(line)
+
+	import pytides
+	return {
+		'created': datetime.utcnow().isoformat(),
+		'python': platform.python_version(),
+		'numpy': np.__version__,
+		'platform': platform.platform(),
+		'pytides': os.path.dirname(pytides.__file__),
+		'quick': quick,
+		'results': results
+	}
+
+def save(results, path):
+	"""
+	Save benchmark results as JSON.
+	"""
+	with open(path, 'w') as fh:
+		json.dump(results, fh, indent = 1, sort_keys = True)
+
+def load(path):
+	"""
+	Load benchmark results saved with save().
+	"""
+	with open(path) as fh:
+		return json.load(fh)
+
+def compare(results, baseline, threshold = 0.1):
+	"""
+	Compare benchmark results with a baseline, returning a list of tuples
+	(name, quantity, baseline value, value, ratio, regressed) for the cases
+	both ran. A case has regressed if its throughput has fallen, or its peak
+	memory risen (by more than a megabyte), by more than the threshold.
+	Arguments:
+	results -- results as returned by run()
+	baseline -- results to compare with
+	threshold -- fractional change beyond which a case has regressed (default: 0.1)
+	"""
+	comparison = []
+	for name in sorted(results['results']):
+		new, old = results['results'][name], baseline['results'].get(name)
+		if old is None or 'error' in old or 'error' in new:
+			continue
+		ratio = new['throughput'] / old['throughput']
+		comparison.append((
+			name, 'throughput', old['throughput'], new['throughput'], ratio,
+			ratio < 1.0 - threshold
+		))
+		ratio = (new['peak_memory'] + 1.0) / (old['peak_memory'] + 1.0)
+		comparison.append((
+			name, 'peak_memory', old['peak_memory'], new['peak_memory'], ratio,
+			ratio > 1.0 + threshold and new['peak_memory'] - old['peak_memory'] > 2**20
+		))
+	return comparison
+
+#Cost of importing pytides over that of numpy, which it can't do without.
+#Prediction mustn't import scipy, which roughly doubles both.
+import_budget = {'seconds': 0.1, 'memory': 8 * 2**20}
+
+_import_script = """
+import resource, sys, time
+def rss():
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+import numpy
+numpy_memory = rss()
+start = time.time()
+import pytides
+print('%r %r %r' % (time.time() - start, rss() - numpy_memory, 'scipy' in sys.modules))
+"""
+
+def imports(repeat = 5, budget = None):
+	"""
+	Measure the time and peak memory of importing pytides (beyond those of
+	numpy) in fresh interpreters, returning a dictionary of the fastest time,
+	the largest memory, whether scipy was imported and a list of the ways in
+	which the budget was exceeded.
+	Arguments:
+	repeat -- number of interpreters to start (default: 5)
+	budget -- dictionary of limits on 'seconds' and 'memory' (default: import_budget)
+	"""
+	budget = import_budget if budget is None else budget
+	root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+	env = dict(os.environ)
+	env['PYTHONPATH'] = os.pathsep.join([root] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+	seconds, memory, scipy = [], [], False
+	for _ in range(repeat):
+		output = subprocess.check_output([sys.executable, '-c', _import_script], env = env)
+		s, m, sp = output.decode().split()
+		seconds.append(float(s))
+		memory.append(int(m))
+		scipy = scipy or sp == 'True'
+	result = {'seconds': min(seconds), 'memory': max(memory), 'scipy': scipy}
+	result['exceeded'] = [
+		key for key in ('seconds', 'memory') if result[key] > budget[key]
+	] + (['scipy'] if scipy else [])
+	return result
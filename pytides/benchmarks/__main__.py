@@ -0,0 +1,59 @@
+import argparse
+import sys
+from pytides import benchmarks
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(
+		prog = 'python -m pytides.benchmarks',
+		description = 'Benchmark pytides on synthetic tides.'
+	)
+	parser.add_argument('cases', nargs = '*', help = 'names (or prefixes such as "at") of the cases to run (default: all)')
+	parser.add_argument('--quick', action = 'store_true', help = 'run only the smaller cases')
+	parser.add_argument('--repeat', type = int, default = 3, help = 'times to time each case, keeping the fastest (default: 3)')
+	parser.add_argument('--timeout', type = float, help = 'seconds after which a case is stopped and recorded as failed')
+	parser.add_argument('--output', help = 'file in which to save the results as JSON')
+	parser.add_argument('--baseline', help = 'JSON results of an earlier run to compare with')
+	parser.add_argument('--threshold', type = float, default = 0.1, help = 'fractional change counted as a regression (default: 0.1)')
+	parser.add_argument('--list', action = 'store_true', help = 'list the cases and exit')
+	parser.add_argument('--imports', action = 'store_true', help = 'check the cost of importing pytides against its budget and exit')
+	args = parser.parse_args(argv)
+
+	if args.imports:
+		result = benchmarks.imports()
+		budget = benchmarks.import_budget
+		print('import pytides %10.4g s (budget %g) %8.1f MB (budget %g) scipy %s' % (
+			result['seconds'], budget['seconds'], result['memory'] / 2.0**20,
+			budget['memory'] / 2.0**20, 'imported' if result['scipy'] else 'not imported'
+		))
+		if result['exceeded']:
+			print('EXCEEDED: %s' % ', '.join(result['exceeded']))
+			return 1
+		return 0
+
+	if args.list:
+		for name, _, unit, _, _, quick in benchmarks.cases:
+			print('%-28s %s%s' % (name, unit, ' (quick)' if quick else ''))
+		return 0
+
+	def log(line):
+		print(line)
+		sys.stdout.flush()
+	results = benchmarks.run(args.cases, args.quick, args.repeat, log, args.timeout)
+	if args.output:
+		benchmarks.save(results, args.output)
+
+	status = 0
+	if args.baseline:
+		print('')
+		print('Compared with %s (threshold %g):' % (args.baseline, args.threshold))
+		for name, quantity, old, new, ratio, regressed in benchmarks.compare(
+				results, benchmarks.load(args.baseline), args.threshold):
+			print('%-28s %-12s %12.4g -> %12.4g (x%.3f)%s' % (
+				name, quantity, old, new, ratio, '  REGRESSED' if regressed else ''
+			))
+			if regressed:
+				status = 1
+	return status
+
+if __name__ == '__main__':
+	sys.exit(main())
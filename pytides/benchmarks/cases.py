@@ -0,0 +1,123 @@
+"""
+Benchmark cases. Each case is a function which takes a size and returns
+(function, count), where function performs the timed work and count is the
+number of units (samples, extrema, fits or calls) it processes.
+"""
+import multiprocessing
+import numpy as np
+from pytides.tide import Tide
+from pytides.astro import astro
+from pytides.extrema_index import ExtremaIndex
+import pytides.constituent as constituent
+
+#Typical relative sizes of the major constituents; the rest are small
+major = {'M2': 1.0, 'S2': 0.33, 'N2': 0.2, 'K1': 0.4, 'O1': 0.3, 'P1': 0.13, 'K2': 0.09}
+
+start = np.datetime64('2000-01-01T00:00:00', 'us')
+
+def model(seed = 0):
+	"""
+	Return a Tide with every NOAA constituent and realistic amplitudes.
+	"""
+	rng = np.random.RandomState(seed)
+	amplitudes = [major.get(c.name, 0.02 * rng.rand()) for c in constituent.noaa]
+	phases = list(360.0 * rng.rand(len(constituent.noaa)))
+	return Tide(constituents = constituent.noaa, amplitudes = amplitudes, phases = phases)
+
+def times(days, minutes):
+	"""
+	Return uniformly spaced datetime64 times covering days at intervals of minutes.
+	"""
+	step = np.timedelta64(int(minutes * 60 * 1e6), 'us')
+	return start + step * np.arange(int(days * 24 * 60 / minutes))
+
+def observations(days, minutes, seed = 0):
+	"""
+	Return times and synthetic observed heights (the model plus noise).
+	"""
+	t = times(days, minutes)
+	rng = np.random.RandomState(seed)
+	return t, model(seed).at(t) + 0.05 * rng.randn(len(t))
+
+def bench_astro(days, minutes):
+	t = times(days, minutes)
+	return (lambda: astro(t)), len(t)
+
+def bench_prepare(days, minutes):
+	#Node factors for every 240 hour partition of the period
+	t = times(days, 60 * 240)
+	return (lambda: Tide._prepare(constituent.noaa, t[0], t)), len(t)
+
+def bench_at(days, minutes):
+	tide, t = model(), times(days, minutes)
+	return (lambda: tide.at(t)), len(t)
+
+def bench_at_threaded(days, minutes):
+	tide, t = model(), times(days, minutes)
+	workers = multiprocessing.cpu_count()
+	return (lambda: tide.at(t, workers = workers)), len(t)
+
+def bench_at_irregular(days, minutes):
+	tide, t = model(), times(days, minutes)
+	rng = np.random.RandomState(0)
+	t = t + (rng.rand(len(t)) * minutes * 30e6).astype('int64').astype('timedelta64[us]')
+	return (lambda: tide.at(t)), len(t)
+
+def bench_decompose(days, minutes, method = 'leastsq'):
+	t, heights = observations(days, minutes)
+	return (lambda: Tide.decompose(heights, t, method = method)), 1
+
+def bench_decompose_linear(days, minutes):
+	return bench_decompose(days, minutes, 'linear')
+
+def bench_extrema(days, minutes):
+	tide = model()
+	t0, t1 = start, start + np.timedelta64(int(days * 86400), 's')
+	count = len(tide.extrema_array(t0, t1)[0])
+	return (lambda: list(tide.extrema(t0, t1))), count
+
+def bench_extrema_array(days, minutes):
+	tide = model()
+	t0, t1 = start, start + np.timedelta64(int(days * 86400), 's')
+	count = len(tide.extrema_array(t0, t1)[0])
+	return (lambda: tide.extrema_array(t0, t1)), count
+
+def bench_extrema_index(days, minutes):
+	tide = model()
+	t0, t1 = start, start + np.timedelta64(int(days * 86400), 's')
+	count = len(ExtremaIndex.build(tide, t0, t1))
+	return (lambda: ExtremaIndex.build(tide, t0, t1)), count
+
+def bench_extrema_index_next(days, minutes):
+	#Next high water after each of many times
+	tide = model()
+	t0, t1 = start, start + np.timedelta64(int(days * 86400), 's')
+	index = ExtremaIndex.build(tide, t0, t1)
+	t = times(days - 1, minutes)
+	return (lambda: [index.next(each, 'H') for each in t]), len(t)
+
+#(name, case, unit, days, minutes, quick) where quick marks the cases run by
+#a quick benchmark
+cases = [
+	('astro/1d@1min',            bench_astro,            'samples', 1,        1,  True),
+	('astro/1y@1h',              bench_astro,            'samples', 365,      60, True),
+	('prepare/19y',              bench_prepare,          'calls',   19*365,   60, True),
+	('at/1d@1min',               bench_at,               'samples', 1,        1,  True),
+	('at/1y@6min',               bench_at,               'samples', 365,      6,  True),
+	('at/1y@1min',               bench_at,               'samples', 365,      1,  False),
+	('at/19y@1h',                bench_at,               'samples', 19*365,   60, True),
+	('at_threaded/1y@1min',      bench_at_threaded,      'samples', 365,      1,  False),
+	('at_threaded/19y@1h',       bench_at_threaded,      'samples', 19*365,   60, True),
+	('at_irregular/1y@1h',       bench_at_irregular,     'samples', 365,      60, True),
+	('at_irregular/19y@1h',      bench_at_irregular,     'samples', 19*365,   60, False),
+	('decompose/1d@1min',        bench_decompose,        'fits',    1,        1,  True),
+	('decompose/30d@6min',       bench_decompose,        'fits',    30,       6,  False),
+	('decompose_linear/30d@6min', bench_decompose_linear, 'fits',   30,       6,  True),
+	('decompose_linear/1y@1h',   bench_decompose_linear, 'fits',    365,      60, True),
+	('decompose_linear/19y@1h',  bench_decompose_linear, 'fits',    19*365,   60, False),
+	('extrema/30d',              bench_extrema,          'extrema', 30,       60, True),
+	('extrema_array/1y',         bench_extrema_array,    'extrema', 365,      60, True),
+	('extrema_array/19y',        bench_extrema_array,    'extrema', 19*365,   60, False),
+	('extrema_index/19y',        bench_extrema_index,    'extrema', 19*365,   60, False),
+	('extrema_index_next/1y@1h', bench_extrema_index_next, 'queries', 365,    60, True),
+]
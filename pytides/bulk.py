@@ -0,0 +1,327 @@
+import os
+import time
+import tempfile
+import multiprocessing
+import numpy as np
+from tide import Tide
+from nodal_table import NodalTable
+from collection import TideCollection
+from store import ModelStore
+import constituent
+
+#State shared by the stations fitted in one worker process
+_shared = {}
+
+def decompose_many(records, workers = None, table_years = 50, **kwargs):
+	"""
+	Fit a Tide to each of many stations' tidal observations, spreading the
+	stations over a pool of worker processes.
+
+	The node factors of the stations are interpolated from NodalTables, each
+	covering the observations of stations within a few years of each other,
+	which are built once, saved to temporary files and mapped into memory by
+	each worker, rather than being evaluated through astro() for each station.
+	One station's failure is recorded in its diagnostics and doesn't affect the
+	others.
+
+	Arguments:
+	records -- list of stations, each a dictionary of arguments to Tide.decompose() (which must
+	           include heights and one of t, t0 and interval) or a tuple (heights, t)
+	workers -- number of worker processes, or 1 to fit in this process (default: the number of CPUs)
+	table_years -- longest period covered by one NodalTable, in years; stations whose observations
+	               span longer use astro() (default: 50)
+	kwargs -- arguments to Tide.decompose() common to every station (for instance method = 'linear'),
+	          overridden by those of the record
+
+	Returns (tides, diagnostics): a list holding each station's Tide (or None
+	if its fit failed), and a list of dictionaries holding, for each station,
+	status -- 'ok' or 'failed'
+	error -- the exception which failed the fit, or None
+	count -- number of observations (None if they couldn't be read)
+	rms -- root mean square residual of the fitted model
+	nfev -- number of function evaluations made by the solver (if reported)
+	ier -- the solver's return code (1 to 4 on success)
+	seconds -- time taken to fit the station
+	The fitted Tides don't keep the NodalTable; their predictions use astro().
+	Use TideCollection(tides) to stack the models for prediction.
+	"""
+	if workers is None:
+		workers = multiprocessing.cpu_count()
+
+	#Constituents are passed to workers by their position in a list of all of
+	#them, since they can't be pickled. A record which can't be read fails
+	#its own station, which is given its error rather than a fit.
+	constituents = [constituent._Z0]
+	index = {id(constituent._Z0): 0}
+	tasks = []
+	for i, record in enumerate(records):
+		try:
+			record = _record(record, kwargs)
+			members = list(record.get('constituents', constituent.noaa))
+			for c in members:
+				if id(c) not in index:
+					index[id(c)] = len(constituents)
+					constituents.append(c)
+			record['constituents'] = [index[id(c)] for c in members]
+			tasks.append((i, record, None))
+		except Exception as e:
+			tasks.append((i, None, _error(e)))
+
+	#Stations whose observations lie within a few years of each other share a
+	#table covering them all, with a margin for the node factors of partitions
+	#(or anchors) reaching beyond the observations. A station whose
+	#observations alone span more than table_years (a corrupt timestamp, say),
+	#or whose table can't be built, falls back to astro().
+	margin = np.timedelta64(int(8766 * 3.6e9), 'us')
+	limit = np.timedelta64(int(table_years * 8766 * 3.6e9), 'us')
+	spans = []
+	for k, (_, record, error) in enumerate(tasks):
+		try:
+			t0, hours = _hours(record)
+			start, end = Tide._times(t0, [np.amin(hours), np.amax(hours)])
+		except Exception:
+			#The station's own fit will fail, and say why
+			continue
+		if end - start <= limit:
+			spans.append((start, end, k))
+	spans.sort(key = lambda span: span[0])
+	clusters = []
+	for start, end, k in spans:
+		if clusters and start - clusters[-1][1] <= 2 * margin and end - clusters[-1][0] <= limit:
+			clusters[-1][1] = max(clusters[-1][1], end)
+			clusters[-1][2].append(k)
+		else:
+			clusters.append([start, end, [k]])
+
+	paths, tables = [], [None] * len(tasks)
+	try:
+		for start, end, members in clusters:
+			try:
+				table = NodalTable.build(constituents, start - margin, end + margin)
+				fd, path = tempfile.mkstemp(suffix = '.npz')
+				os.close(fd)
+				paths.append(path)
+				table.save(path)
+			except Exception:
+				continue
+			for k in members:
+				tables[k] = len(paths) - 1
+		tasks = [task + (table,) for task, table in zip(tasks, tables)]
+		if workers == 1:
+			_initialise(constituents, paths)
+			results = [_fit(task) for task in tasks]
+		else:
+			pool = multiprocessing.Pool(workers, _initialise, (constituents, paths))
+			try:
+				results = pool.map(_fit, tasks, chunksize = 1)
+			finally:
+				pool.close()
+				pool.join()
+	finally:
+		_shared.clear()
+		for path in paths:
+			os.remove(path)
+
+	tides, diagnostics = [None] * len(tasks), [None] * len(tasks)
+	for i, model, info in results:
+		if model is not None:
+			members, amplitudes, phases = model
+			fitted = np.zeros(len(members), dtype=Tide.dtype)
+			fitted['constituent'] = [constituents[j] for j in members]
+			fitted['amplitude'] = amplitudes
+			fitted['phase'] = phases
+			tides[i] = Tide(model = fitted)
+		diagnostics[i] = info
+	return tides, diagnostics
+
+def _record(record, defaults):
+	#Records are dictionaries of arguments to Tide.decompose(), or (heights, t)
+	if not isinstance(record, dict):
+		heights, t = record
+		record = {'heights': heights, 't': t}
+	arguments = dict(defaults)
+	arguments.update(record)
+	for key in ('initial', 'callback', 'chunk', 'table'):
+		if arguments.get(key) is not None:
+			raise ValueError("%s is not supported by decompose_many." % key)
+		arguments.pop(key, None)
+	arguments.pop('full_output', None)
+	return arguments
+
+def _hours(record):
+	"""
+	Return the initial time (as datetime64) and the hours since it of the
+	observations of a record, as Tide.decompose() would identify them.
+	"""
+	t0, hours = Tide._observation_hours(
+		len(record['heights']) if record.get('interval') is not None else None,
+		record.get('t'), record.get('t0'), record.get('interval')
+	)
+	return Tide._datetime64(t0), hours
+
+def _initialise(constituents, paths):
+	_shared['constituents'] = constituents
+	_shared['tables'] = [NodalTable.load(path) for path in paths]
+
+def _fit(task):
+	"""
+	Fit one station in a worker, returning (i, model, diagnostics) where model
+	is (constituent positions, amplitudes, phases) or None if the fit failed.
+	"""
+	i, record, error, table = task
+	start = time.time()
+	info = {
+		'status': 'ok', 'error': None, 'count': None,
+		'rms': None, 'nfev': None, 'ier': None
+	}
+	model = None
+	try:
+		if error is not None:
+			raise _Invalid(error)
+		constituents = _shared['constituents']
+		arguments = dict(record)
+		arguments['constituents'] = [constituents[j] for j in record['constituents']]
+		arguments['heights'] = heights = np.asarray(record['heights'], dtype=float)
+		info['count'] = len(heights)
+		tide, lsq = Tide.decompose(
+			full_output = True, table = None if table is None else _shared['tables'][table], **arguments
+		)
+
+		t0, hours = _hours(record)
+		residual = heights - tide.at(Tide._times(t0, hours))
+		info['rms'] = float(np.sqrt(np.mean(residual**2)))
+		info['ier'] = int(lsq[-1])
+		if len(lsq) > 2:
+			info['nfev'] = lsq[2].get('nfev')
+
+		position = dict((id(c), j) for j, c in enumerate(constituents))
+		model = (
+			[position[id(c)] for c in tide.model['constituent']],
+			tide.model['amplitude'].copy(),
+			tide.model['phase'].copy()
+		)
+	except _Invalid as e:
+		info['status'], info['error'] = 'failed', str(e)
+	except Exception as e:
+		info['status'], info['error'] = 'failed', _error(e)
+	info['seconds'] = time.time() - start
+	return i, model, info
+
+class _Invalid(Exception):
+	#The error of a record which couldn't be read, already described
+	pass
+
+def _error(e):
+	return '%s: %s' % (type(e).__name__, e)
+
+def predict_many(models, t, stations = None, path = None, workers = None, chunk = 64, progress = None):
+	"""
+	Predict the tidal heights of many stations at the same times, spreading
+	the stations over a pool of worker processes.
+
+	The heights are written by the workers straight into one (stations, times)
+	array, in shared memory or a memory mapped .npy file, rather than being
+	pickled back to this process. Each worker predicts chunks of stations
+	together with a TideCollection.
+
+	Arguments:
+	models -- list of Tides, or the file name of a ModelStore (which each worker maps into memory)
+	t -- array of times (datetimes, datetime64 or seconds since the unix epoch) at which to evaluate the tidal heights
+	stations -- with a ModelStore, the ids of the stations to predict (default: all of them, in the store's order)
+	path -- optional file name of a .npy file in which to write the heights (default: shared memory)
+	workers -- number of worker processes, or 1 to predict in this process (default: the number of CPUs)
+	chunk -- number of stations predicted together (default: 64)
+	progress -- optional function called with (stations done, stations) as each chunk completes
+
+	Returns (heights, timings): the (stations, times) array of heights (memory
+	mapped if path is given), and a dictionary holding
+	seconds -- time taken overall
+	workers -- a list of dictionaries holding, for each worker process, its
+	           pid and the number of chunks and stations it predicted and the
+	           time it spent doing so
+	Models given as Tides are passed to the workers with Tide.numeric(), so
+	their constituents must be registered (see constituent.register).
+	"""
+	start = time.time()
+	if workers is None:
+		workers = multiprocessing.cpu_count()
+	if isinstance(models, str):
+		store = ModelStore.load(models)
+		stations = list(store) if stations is None else [str(station) for station in stations]
+		for station in stations:
+			if station not in store:
+				raise KeyError(station)
+		source = ('store', models, stations)
+		count = len(stations)
+	else:
+		source = ('models', [tide.numeric() for tide in models])
+		count = len(models)
+	t = Tide._as_times(t)
+	shape = (count, len(t))
+
+	if path is not None:
+		heights = np.lib.format.open_memmap(path, mode = 'w+', dtype = float, shape = shape)
+		buffer = None
+	elif workers == 1:
+		heights, buffer = np.empty(shape), None
+	else:
+		buffer = multiprocessing.RawArray('d', max(shape[0] * shape[1], 1))
+		heights = np.frombuffer(buffer, dtype = float, count = shape[0] * shape[1]).reshape(shape)
+
+	tasks = [(i, min(i + chunk, count)) for i in range(0, count, chunk)]
+	done, timings = 0, {}
+	pool = None
+	try:
+		if workers == 1:
+			_shared['heights'] = heights
+			_initialise_prediction(source, t, None, None, shape)
+			results = (_predict(task) for task in tasks)
+		else:
+			pool = multiprocessing.Pool(workers, _initialise_prediction, (source, t, buffer, path, shape))
+			results = pool.imap_unordered(_predict, tasks)
+		for pid, rows, seconds in results:
+			timing = timings.setdefault(pid, {'pid': pid, 'chunks': 0, 'stations': 0, 'seconds': 0.0})
+			timing['chunks'] += 1
+			timing['stations'] += rows
+			timing['seconds'] += seconds
+			done += rows
+			if progress:
+				progress(done, count)
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+		_shared.clear()
+	if path is not None:
+		heights.flush()
+	return heights, {
+		'seconds': time.time() - start,
+		'workers': sorted(timings.values(), key = lambda timing: timing['pid'])
+	}
+
+def _initialise_prediction(source, t, buffer, path, shape):
+	_shared['source'] = source
+	_shared['t'] = t
+	if source[0] == 'store':
+		_shared['store'] = ModelStore.load(source[1])
+	#The heights are shared with the parent (and the other workers), which
+	#read them once every chunk is done.
+	if path is not None:
+		_shared['heights'] = np.load(path, mmap_mode = 'r+')
+	elif buffer is not None:
+		_shared['heights'] = np.frombuffer(buffer, dtype = float, count = shape[0] * shape[1]).reshape(shape)
+
+def _predict(task):
+	"""
+	Predict the stations of rows [first, last) in a worker, writing their
+	heights in place and returning (pid, number of stations, seconds).
+	"""
+	first, last = task
+	start = time.time()
+	source = _shared['source']
+	if source[0] == 'store':
+		tides = [_shared['store'][station] for station in source[2][first:last]]
+	else:
+		tides = [Tide.from_numeric(model) for model in source[1][first:last]]
+	TideCollection(tides).at(_shared['t'], out = _shared['heights'][first:last])
+	return os.getpid(), last - first, time.time() - start
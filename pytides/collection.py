@@ -0,0 +1,88 @@
+try:
+	from itertools import izip
+except ImportError: #Python3
+	izip = zip
+import numpy as np
+from tide import Tide
+from partition import PartitionIndex
+import constituent
+
+d2r, r2d = np.pi/180.0, 180.0/np.pi
+
+class TideCollection(object):
+	"""
+	Many tidal models (for instance, one per station) stacked over the union of
+	their constituents, so that speed, u, f and V0 are prepared once for all of
+	them and heights for every station are found with one matrix product per
+	partition.
+	"""
+
+	def __init__(self, tides):
+		"""
+		Arguments:
+		tides -- list of Tide instances
+		"""
+		self.tides = list(tides)
+		#Constituents are matched by identity, since constituents which are
+		#equal (travel at the same speed) may still differ in phase.
+		self.constituents = []
+		index = {}
+		for tide in self.tides:
+			for c in tide.model['constituent']:
+				if id(c) not in index:
+					index[id(c)] = len(self.constituents)
+					self.constituents.append(c)
+		self.constituent_set = constituent.ConstituentSet(self.constituents)
+
+		#Each model is held as cosine and sine coefficients (H cos p, H sin p),
+		#so that stations missing a constituent just have zero coefficients.
+		shape = (len(self.tides), len(self.constituents))
+		self.coefficients = np.zeros((shape[0], 2*shape[1]))
+		for s, tide in enumerate(self.tides):
+			for c, amplitude, phase in tide.model:
+				i = index[id(c)]
+				self.coefficients[s, i] += amplitude * np.cos(d2r*phase)
+				self.coefficients[s, shape[1] + i] += amplitude * np.sin(d2r*phase)
+
+	def __len__(self):
+		return len(self.tides)
+
+	def amplitudes(self):
+		"""
+		Return the (stations, constituents) array of amplitudes.
+		"""
+		n = len(self.constituents)
+		return np.hypot(self.coefficients[:, :n], self.coefficients[:, n:])
+
+	def phases(self):
+		"""
+		Return the (stations, constituents) array of phases in degrees.
+		"""
+		n = len(self.constituents)
+		return np.mod(r2d*np.arctan2(self.coefficients[:, n:], self.coefficients[:, :n]), 360.0)
+
+	def at(self, t, out = None):
+		"""
+		Return the modelled tidal heights of every station at given times, as
+		an array of shape (stations, times).
+		Arguments:
+		t -- array of times (datetimes, datetime64 or seconds since the unix epoch) at which to evaluate the tidal heights
+		out -- optional array of shape (stations, times) in which to write the heights
+		"""
+		t = Tide._as_times(t)
+		t0 = t[0]
+		hours = np.atleast_1d(Tide._hours(t0, t))
+		partition = 240.0
+		#Heights are written in place, so times needn't be in order
+		index = PartitionIndex(hours, partition, keep_order = True)
+		times = Tide._times(t0, index.midpoints())
+		speed, u, f, V0 = Tide._prepare(self.constituent_set, t0, times, radians = True)
+
+		heights = np.empty((len(self.tides), len(hours))) if out is None else out
+		for i, u_i, f_i in izip(range(len(index)), u, f):
+			t_i = index[i]
+			if len(t_i):
+				heights[:, index.positions(i)] = np.dot(
+					self.coefficients, Tide._design(t_i, speed, u_i, f_i, V0)
+				)
+		return heights
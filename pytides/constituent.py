@@ -81,6 +81,102 @@ class CompoundConstituent(BaseConstituent):
 	def f(self, a):
 		return reduce(op.mul, [c.f(a) ** abs(n) for (c,n) in self.members])
 
+class ConstituentSet(object):
+	"""
+	A list of constituents compiled into coefficient tables, so that V, speed,
+	u and f may be evaluated for all of them at once. Each node factor function
+	(nc.u_M2, nc.f_O1, ...) is evaluated only once and shared between the
+	constituents, compound or otherwise, which depend on it.
+	"""
+
+	def __init__(self, constituents):
+		"""
+		Arguments:
+		constituents -- list of constituents to compile (e.g. constituent.noaa)
+		"""
+		self.constituents = list(constituents)
+		n = len(self.constituents)
+		#Doodson coefficients, one row per constituent
+		self.coefficients = np.array(
+			[c.coefficients for c in self.constituents], dtype=float
+		).reshape(n, 7)
+		#Node factor functions and the multipliers (for u) and exponents (for f)
+		#with which each constituent depends upon them.
+		u_terms = [self._node_terms(c, 'u', lambda m, k: m*k) for c in self.constituents]
+		f_terms = [self._node_terms(c, 'f', lambda m, k: m*abs(k)) for c in self.constituents]
+		self.u_functions, self.u_multipliers = self._tabulate(u_terms, nc.u_zero)
+		self.f_functions, self.f_exponents = self._tabulate(f_terms, nc.f_unity)
+
+	def __len__(self):
+		return len(self.constituents)
+
+	def __iter__(self):
+		return iter(self.constituents)
+
+	@staticmethod
+	def _node_terms(c, name, combine, multiplier=1):
+		"""
+		Return a list of (function, multiplier) pairs for the node factor `name`
+		of constituent c, expanding the members of compound constituents which
+		use the default (member derived) node factors.
+		"""
+		function = getattr(c, name)
+		if isinstance(c, CompoundConstituent) and getattr(function, '__self__', None) is c:
+			return [
+				term for (member, k) in c.members
+				for term in ConstituentSet._node_terms(member, name, combine, combine(multiplier, k))
+			]
+		return [(function, multiplier)]
+
+	@staticmethod
+	def _tabulate(terms, identity):
+		"""
+		Return the distinct functions in terms and a table with one row per
+		constituent of the accumulated multiplier for each function.
+		"""
+		functions = []
+		for row in terms:
+			for function, _ in row:
+				if function is not identity and not any(function is g for g in functions):
+					functions.append(function)
+		table = np.zeros((len(terms), len(functions)))
+		for i, row in enumerate(terms):
+			for function, multiplier in row:
+				for j, g in enumerate(functions):
+					if function is g:
+						table[i, j] += multiplier
+		return functions, table
+
+	@staticmethod
+	def _evaluate(functions, a):
+		#Evaluate each function on the astronomical arguments a, giving one row
+		#per function (with one column per time if a holds arrays).
+		shape = np.shape(a['N'].value)
+		return np.array([np.ones(shape) * g(a) for g in functions]).reshape((len(functions),) + shape)
+
+	def astro_xdo(self, a):
+		return [a['T+h-s'], a['s'], a['h'], a['p'], a['N'], a['pp'], a['90']]
+
+	def astro_speeds(self, a):
+		return np.array([each.speed for each in self.astro_xdo(a)])
+
+	def astro_values(self, a):
+		return np.array([each.value for each in self.astro_xdo(a)])
+
+	def V(self, a):
+		return np.dot(self.coefficients, self.astro_values(a))
+
+	def speed(self, a):
+		return np.dot(self.coefficients, self.astro_speeds(a))
+
+	def u(self, a):
+		return np.dot(self.u_multipliers, self._evaluate(self.u_functions, a))
+
+	def f(self, a):
+		values = self._evaluate(self.f_functions, a)
+		exponents = self.f_exponents.reshape(self.f_exponents.shape + (1,) * (values.ndim - 1))
+		return np.prod(values[np.newaxis] ** exponents, axis=1)
+
 ###### Base Constituents
 #Long Term
 _Z0      = BaseConstituent(name = 'Z0',      xdo = 'Z ZZZ ZZZ', u = nc.u_zero, f = nc.f_unity)
@@ -158,3 +254,45 @@ noaa = [
 	_M8, _MS4
 ]
 
+
+#Every constituent is given an integer id, its position in the registry, so
+#that models can refer to constituents without holding Python objects. The
+#ids of the constituents defined here are fixed: only append to this list.
+registry = [
+	_Z0, _Sa, _Ssa, _Mm, _Mf, _Q1, _O1, _K1, _J1, _M1, _P1, _S1, _OO1,
+	_2N2, _N2, _nu2, _M2, _lambda2, _L2, _T2, _S2, _R2, _K2, _M3,
+	_MSF, _2Q1, _rho1, _mu2, _2SM2, _2MK3, _MK3, _MN4, _M4, _MS4, _S4,
+	_M6, _S6, _M8
+]
+_ids = dict((id(c), i) for i, c in enumerate(registry))
+_names = dict((c.name, i) for i, c in enumerate(registry))
+
+def register(c):
+	"""
+	Add a constituent to the registry (if it isn't already there) and return
+	its id. Constituents registered at run time are only given the same ids in
+	another process if they are registered in the same order.
+	"""
+	if id(c) not in _ids:
+		_ids[id(c)] = len(registry)
+		_names.setdefault(c.name, len(registry))
+		registry.append(c)
+	return _ids[id(c)]
+
+def identify(c):
+	"""
+	Return the id of a registered constituent.
+	"""
+	try:
+		return _ids[id(c)]
+	except KeyError:
+		raise ValueError("Constituent %s is not registered." % c.name)
+
+def named(name):
+	"""
+	Return the id of the registered constituent with the given name.
+	"""
+	try:
+		return _names[name]
+	except KeyError:
+		raise ValueError("No constituent named %s is registered." % name)
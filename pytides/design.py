@@ -0,0 +1,117 @@
+try:
+	from itertools import izip
+except ImportError: #Python3
+	izip = zip
+import numpy as np
+from tide import Tide
+from partition import PartitionIndex
+import constituent
+
+class HarmonicDesign(object):
+	"""
+	The design of a linear harmonic analysis for one set of observation times,
+	built and factorized once so that any number of height series observed at
+	those times (co-located instruments, ensemble members) can be fitted by
+	matrix products alone.
+
+	The constituents are selected as by Tide.decompose(), and the fit is the
+	joint least squares fit of the constituents and z0 (as by its linear
+	method for chunked input). The pseudo-inverse of the (centred) normal
+	matrix is computed once; each solve() then costs a product of the (2n, N)
+	design with the heights.
+	"""
+
+	def __init__(
+			self,
+			t            = None,
+			t0           = None,
+			interval     = None,
+			count        = None,
+			constituents = constituent.noaa,
+			n_period     = 2,
+			table        = None,
+			node_tolerance = None
+		):
+		"""
+		Arguments:
+		t -- ndarray of observation times (see Tide.decompose())
+		t0 -- time at which the first observation was recorded, or from which hours t are counted
+		interval -- hourly interval between observations
+		count -- number of observations (needed only with t0 and interval)
+		constituents -- list of constituents to use in the fit (default: constituent.noaa)
+		n_period -- only include constituents which complete at least this many periods (default: 2)
+		table -- optional NodalTable to use for node factors; the fitted Tides will also use it
+		node_tolerance -- see Tide.decompose()
+		"""
+		t0, hours = Tide._observation_hours(count, t, t0, interval)
+		self.t0, self.table = t0, table
+
+		self.constituents = Tide._select_constituents(constituents, t0, np.ptp(hours), n_period)
+		n = len(self.constituents)
+
+		if node_tolerance is None:
+			partition = 240.0
+		else:
+			speed, V0, anchors, F, jumps = Tide._node_anchors(
+				self.constituents, t0, np.amin(hours), np.amax(hours), node_tolerance, table
+			)
+			partition = anchors[1] - anchors[0]
+		self.index = PartitionIndex(hours, partition)
+		t = list(self.index)
+		if node_tolerance is None:
+			times = Tide._times(t0, self.index.midpoints())
+			speed, u, f, V0 = Tide._prepare(self.constituents, t0, times, radians = True, table = table)
+		else:
+			u, f = zip(*[Tide._node_factors(anchors, F, t_i, jumps) for t_i in t])
+
+		self.X = np.concatenate(
+			[np.zeros((2*n, 0))] + [Tide._design(t_i, speed, u_i, f_i, V0) for t_i, u_i, f_i in izip(t, u, f)],
+			axis=1
+		)
+		self.count = self.X.shape[1]
+		#Fitting relative to the mean of the heights centres the design
+		self.mean = np.mean(self.X, axis=1)
+		XX = np.dot(self.X, self.X.T) - self.count * np.outer(self.mean, self.mean)
+		self.inverse = np.linalg.pinv(XX)
+		self.rank = np.linalg.matrix_rank(XX)
+
+	def __len__(self):
+		return self.count
+
+	def solve(self, heights, full_output = False):
+		"""
+		Return a list of Tides fitted to each column of heights.
+		Arguments:
+		heights -- ndarray of shape (N,) or (N, k) of heights observed at the design's times (in their original order)
+		full_output -- whether to also return, for each column, a tuple in the style of scipy's leastsq as
+		               returned by Tide.decompose(method = 'linear') (default: False)
+		"""
+		heights = np.asarray(heights, dtype=float)
+		if heights.ndim == 1:
+			heights = heights[:, np.newaxis]
+		if len(heights) != self.count:
+			raise ValueError("Expected %d heights per series, got %d." % (self.count, len(heights)))
+		heights = self.index.sort(heights)
+		z0 = np.mean(heights, axis=0)
+		n = len(self.constituents)
+
+		Xy = np.dot(self.X, heights) - self.count * np.outer(self.mean, z0)
+		c = np.dot(self.inverse, Xy)
+		rss = np.sum(heights**2, axis=0) - self.count * z0**2 - np.sum(c * Xy, axis=0)
+		#The level fitted together with the constituents, which rss describes
+		z0 = z0 - np.dot(self.mean, c)
+
+		tides, output = [], []
+		solution = (c, self.inverse, np.maximum(rss, 0.0), self.rank)
+		for j in range(heights.shape[1]):
+			lsq = Tide._solve_linear(solution, j)
+			model = np.zeros(1+n, dtype=Tide.dtype)
+			model[0] = (constituent._Z0, z0[j], 0)
+			model[1:]['constituent'] = self.constituents[:]
+			model[1:]['amplitude'] = lsq[0][:n]
+			model[1:]['phase'] = lsq[0][n:]
+			tides.append(Tide(model = model, radians = True, table = self.table))
+			output.append(lsq)
+		if full_output:
+			return tides, output
+		return tides
@@ -0,0 +1,166 @@
+import time
+from datetime import datetime
+import numpy as np
+from tide import Tide
+from nodal_table import NodalTable
+
+class ExtremaIndex(object):
+	"""
+	The high and low tides of one station over a long period (for instance 50
+	years), found once with Tide.extrema_array() and held as sorted arrays, so
+	that the next or previous high or low after any time, or those between two
+	times, are found by binary search rather than by searching the tidal
+	series again.
+
+	An index takes 17 bytes per extremum (about 1.2 MB for 50 years of a
+	semidiurnal tide) and can be saved to an uncompressed .npz file, which
+	load() maps into memory.
+	"""
+
+	def __init__(self, times, heights, high, start, end, seconds = None):
+		"""
+		Arguments:
+		times -- sorted times of the extrema, as int64 microseconds since the unix epoch
+		heights -- heights of the extrema
+		high -- boolean array, True for high tides and False for low tides
+		start, end -- the period searched, as int64 microseconds since the unix epoch
+		seconds -- optional time taken to build the index
+		"""
+		self.times = np.asarray(times).view('datetime64[us]')
+		self.heights = heights
+		self.high = high
+		self.start = np.int64(start).astype('datetime64[us]')
+		self.end = np.int64(end).astype('datetime64[us]')
+		self.seconds = seconds
+
+	@classmethod
+	def build(cls, tide, t0, t1, partition = 240.0, tolerance = 1e-9, chunk = 40):
+		"""
+		Find the extrema of a Tide between two times.
+		Arguments:
+		tide -- Tide instance
+		t0 -- start of the period (datetime, datetime64 or seconds since the unix epoch)
+		t1 -- end of the period
+		partition -- see Tide.extrema_array(); since the index is built once, the
+		             node factors are by default held constant over 240 hours as
+		             in Tide.at, rather than 2400 (default: 240.0)
+		tolerance -- see Tide.extrema_array() (default: 1e-9)
+		chunk -- number of partitions searched at once, which bounds the memory used (default: 40)
+		"""
+		started = time.time()
+		t0, t1 = Tide._datetime64(Tide._as_times(t0)), Tide._datetime64(Tide._as_times(t1))
+		span = Tide._hours(t0, t1)
+		#Chunks are whole numbers of partitions from t0, so each partition has
+		#the same node factors as it would in a single call.
+		step = chunk * partition
+		times, heights, hilo = [np.zeros(0, dtype='datetime64[us]')], [np.zeros(0)], [np.zeros(0, dtype=bool)]
+		for k in range(max(int(np.ceil(span / step)), 1)):
+			a, b = Tide._times(t0, [k * step, min((k + 1) * step, span)])
+			t, h, hl = tide.extrema_array(a, b, partition, tolerance)
+			times.append(Tide._datetime64(t))
+			heights.append(h)
+			hilo.append(hl == 'H')
+		times = np.concatenate(times)
+		#An extremum on the boundary of two chunks may be found in both (to
+		#within the tolerance), but extrema are hours apart
+		keep = np.append(True, np.diff(times.view('int64')) > 60e6)[:len(times)]
+		return cls(
+			times[keep].view('int64'), np.concatenate(heights)[keep], np.concatenate(hilo)[keep],
+			t0.astype('int64'), t1.astype('int64'), time.time() - started
+		)
+
+	def save(self, path):
+		"""
+		Write the index to an uncompressed .npz file.
+		"""
+		np.savez(
+			path,
+			times = self.times.view('<i8'),
+			heights = np.asarray(self.heights, dtype='<f8'),
+			high = np.asarray(self.high, dtype=bool),
+			start = self.start.astype('<i8'),
+			end = self.end.astype('<i8'),
+			seconds = np.float64(np.nan if self.seconds is None else self.seconds)
+		)
+
+	@classmethod
+	def load(cls, path, mmap = True):
+		"""
+		Open an index written by ExtremaIndex.save().
+		Arguments:
+		path -- file name
+		mmap -- whether to map the arrays into memory read-only rather than read them (default: True)
+		"""
+		arrays = NodalTable._memmap_npz(path) if mmap else dict(np.load(path))
+		seconds = float(arrays['seconds'])
+		return cls(
+			arrays['times'], arrays['heights'], arrays['high'], arrays['start'][()], arrays['end'][()],
+			None if np.isnan(seconds) else seconds
+		)
+
+	def __len__(self):
+		return len(self.times)
+
+	@property
+	def nbytes(self):
+		"""
+		Size of the index's arrays in bytes.
+		"""
+		return self.times.nbytes + self.heights.nbytes + self.high.nbytes
+
+	def next(self, t, hilo = None):
+		"""
+		Return (time, height, hilo) of the first extremum after a time, where
+		hilo is 'H' for a high tide and 'L' for a low tide.
+		Arguments:
+		t -- time (datetime, datetime64 or seconds since the unix epoch)
+		hilo -- optionally 'H' or 'L' to find only high or low tides
+		Raises ValueError if the extremum lies beyond the period of the index.
+		"""
+		i = np.searchsorted(self.times, self._datetime64(t), side = 'right')
+		#Highs and lows alternate, so the one sought is at most one further on
+		if hilo is not None and i < len(self) and self._hilo(i) != hilo:
+			i += 1
+		if not self.start <= self._datetime64(t) or i >= len(self):
+			raise ValueError("No extremum after %s within the period of the index." % t)
+		return self._extremum(t, i)
+
+	def previous(self, t, hilo = None):
+		"""
+		Return (time, height, hilo) of the last extremum before a time (see
+		ExtremaIndex.next()).
+		"""
+		i = np.searchsorted(self.times, self._datetime64(t), side = 'left') - 1
+		if hilo is not None and i >= 0 and self._hilo(i) != hilo:
+			i -= 1
+		if not self._datetime64(t) <= self.end or i < 0:
+			raise ValueError("No extremum before %s within the period of the index." % t)
+		return self._extremum(t, i)
+
+	def between(self, t0, t1):
+		"""
+		Return the extrema between two times as arrays (times, heights, hilo)
+		like Tide.extrema_array().
+		Arguments:
+		t0 -- time after which extrema are sought
+		t1 -- time before which extrema are sought
+		"""
+		if self._datetime64(t0) < self.start or self._datetime64(t1) > self.end:
+			raise ValueError("Times outside the period of the index.")
+		i, j = np.searchsorted(self.times, [self._datetime64(t0), self._datetime64(t1)])
+		times = np.array(self.times[i:j])
+		if isinstance(t0, datetime):
+			times = times.astype(object)
+		return times, np.array(self.heights[i:j]), np.where(self.high[i:j], 'H', 'L')
+
+	@staticmethod
+	def _datetime64(t):
+		return Tide._datetime64(Tide._as_times(t))
+
+	def _hilo(self, i):
+		return 'H' if self.high[i] else 'L'
+
+	def _extremum(self, t, i):
+		#Times are datetimes if the query was a datetime, as with Tide.extrema
+		found = self.times[i]
+		return (found.astype(object) if isinstance(t, datetime) else found), float(self.heights[i]), self._hilo(i)
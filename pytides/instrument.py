@@ -0,0 +1,139 @@
+"""
+Instrumentation of the stages of pytides' work (partitioning, preparing node
+factors, evaluating series, solving), for finding where the time goes.
+
+Collection is off unless a hook is registered; until then each instrumented
+stage costs a single function call. To collect timings:
+
+	with instrument.collect() as stats:
+		tide = Tide.decompose(heights, t)
+	print(stats.report())
+
+stats.stages maps the name of each stage (such as 'decompose.jacobian') to
+its number of calls, total wall time in seconds, and the total and largest
+sizes of the arrays it processed; stats.events maps the name of each event
+(such as 'decompose.leastsq', which holds the solver's number of function
+evaluations and final cost) to the list of values recorded. Stages may be
+nested, in which case the time of the inner stage is also counted in the
+outer.
+
+Any object with methods stage(name, seconds, size) and event(name, values)
+can be registered with add() to receive the measurements as they are made.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer
+
+_hooks = []
+
+class Instrumentation(object):
+	"""
+	A hook accumulating statistics of each stage and the values of each event.
+	"""
+
+	def __init__(self):
+		self.stages = OrderedDict()
+		self.events = OrderedDict()
+
+	def stage(self, name, seconds, size):
+		if name not in self.stages:
+			self.stages[name] = {'calls': 0, 'seconds': 0.0, 'size': 0, 'max_size': 0}
+		stats = self.stages[name]
+		stats['calls'] += 1
+		stats['seconds'] += seconds
+		if size is not None:
+			stats['size'] += size
+			stats['max_size'] = max(stats['max_size'], size)
+
+	def event(self, name, values):
+		self.events.setdefault(name, []).append(values)
+
+	def report(self):
+		"""
+		Return a table of the stages and events as a string.
+		"""
+		lines = ['%-24s %8s %12s %14s %12s' % ('stage', 'calls', 'seconds', 'size', 'max size')]
+		for name, stats in self.stages.items():
+			lines.append('%-24s %8d %12.6f %14d %12d' % (
+				name, stats['calls'], stats['seconds'], stats['size'], stats['max_size']
+			))
+		for name, values in self.events.items():
+			for each in values:
+				lines.append('%-24s %s' % (name, ', '.join(
+					'%s=%s' % (key, each[key]) for key in sorted(each)
+				)))
+		return '\n'.join(lines)
+
+class _Stage(object):
+	__slots__ = ('name', 'size', 'start')
+
+	def __init__(self, name, size):
+		self.name, self.size = name, size
+
+	def __enter__(self):
+		self.start = default_timer()
+		return self
+
+	def __exit__(self, *exc):
+		seconds = default_timer() - self.start
+		for hook in list(_hooks):
+			hook.stage(self.name, seconds, self.size)
+		return False
+
+class _Null(object):
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		return False
+
+_null = _Null()
+
+def active():
+	"""
+	Return whether any hook is registered.
+	"""
+	return bool(_hooks)
+
+def stage(name, size = None):
+	"""
+	Return a context manager timing a stage of work.
+	Arguments:
+	name -- name of the stage
+	size -- optional size of the arrays processed by the stage
+	"""
+	if not _hooks:
+		return _null
+	return _Stage(name, size)
+
+def event(name, **values):
+	"""
+	Record values (such as solver diagnostics) with every hook.
+	"""
+	for hook in list(_hooks):
+		hook.event(name, values)
+
+def add(hook):
+	"""
+	Register a hook to receive measurements.
+	"""
+	_hooks.append(hook)
+
+def remove(hook):
+	"""
+	Unregister a hook.
+	"""
+	_hooks.remove(hook)
+
+@contextmanager
+def collect(hook = None):
+	"""
+	Context manager registering a hook (by default a new Instrumentation) for
+	the duration of the block, and yielding it.
+	"""
+	hook = Instrumentation() if hook is None else hook
+	add(hook)
+	try:
+		yield hook
+	finally:
+		remove(hook)
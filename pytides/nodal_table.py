@@ -0,0 +1,206 @@
+import struct
+import zipfile
+import numpy as np
+from astro import astro
+from tide import Tide
+import constituent
+
+d2r, r2d = np.pi/180.0, 180.0/np.pi
+
+class NodalTable(object):
+	"""
+	Precomputed speed, equilibrium argument V and node factors u and f of a set
+	of constituents on a uniform time grid, from which they are linearly
+	interpolated instead of being evaluated through astro().
+
+	The table's error bound (NodalTable.error) is measured when it is built,
+	by comparing the interpolated values at the midpoint of every grid interval
+	(where linear interpolation is least accurate) with exact values, and is
+	given per constituent. Angles are stored unwrapped so that they interpolate
+	smoothly; node factors which are themselves discontinuous (such as u for
+	M1, which jumps by 180 degrees) can't be interpolated across their jumps,
+	and their error bound says so. With the default daily step the errors for
+	the other NOAA constituents are below 1e-4 (degrees, for V and u).
+
+	Tables are saved as uncompressed .npz files, whose arrays load() maps into
+	memory read-only, so many processes can share one table file.
+	"""
+
+	def __init__(self, names, start, step, V, speed, u, f, error):
+		"""
+		Arguments:
+		names -- constituent names, one per column of the tables
+		start -- datetime64 of the first row of the tables
+		step -- hours between rows
+		V -- (rows, constituents) equilibrium arguments, unwrapped in time (degrees)
+		speed -- (rows, constituents) speeds (degrees per hour)
+		u -- (rows, constituents) node factors u, unwrapped in time (degrees)
+		f -- (rows, constituents) node factors f
+		error -- dictionary of the maximum interpolation errors of V, speed, u and f, per constituent
+		"""
+		self.names = [str(name) for name in names]
+		self.index = dict((name, i) for i, name in enumerate(self.names))
+		self.start = np.datetime64(start, 'us')
+		self.step = float(step)
+		self.V, self.speed, self.u, self.f = V, speed, u, f
+		self.error = error
+
+	@classmethod
+	def build(cls, constituents, start, end, step = 24.0):
+		"""
+		Return a table for the given constituents covering start to end.
+		Arguments:
+		constituents -- list (or ConstituentSet) of constituents to tabulate
+		start -- first time covered by the table (datetime, datetime64 or seconds since the unix epoch)
+		end -- last time covered by the table
+		step -- hours between rows of the table (default: 24.0)
+		"""
+		if not isinstance(constituents, constituent.ConstituentSet):
+			constituents = constituent.ConstituentSet(constituents)
+		start = Tide._datetime64(start)
+		rows = int(np.ceil(Tide._hours(start, Tide._as_times(end)) / step)) + 1
+		rows = max(rows, 2)
+
+		def evaluate(hours):
+			a = astro(Tide._times(start, hours))
+			return (
+				constituents.V(a).T, constituents.speed(a).T,
+				constituents.u(a).T, constituents.f(a).T
+			)
+
+		V, speed, u, f = evaluate(step * np.arange(rows))
+		V = cls._unwrap(V, speed, step)
+		u = r2d*np.unwrap(d2r*u, axis=0)
+
+		#Measure the error of interpolating to the midpoint of each interval
+		exact = evaluate(step * (np.arange(rows - 1) + 0.5))
+		error = {}
+		for name, table, value in zip(['V', 'speed', 'u', 'f'], [V, speed, u, f], exact):
+			difference = 0.5*(table[:-1] + table[1:]) - value
+			if name in ('V', 'u'):
+				difference = np.mod(difference + 180.0, 360.0) - 180.0
+			error[name] = np.amax(np.abs(difference), axis=0) if difference.size else np.zeros(len(constituents))
+
+		names = [c.name for c in constituents]
+		return cls(names, start, step, V, speed, u, f, error)
+
+	@staticmethod
+	def _unwrap(V, speed, step):
+		#V advances by hundreds of degrees per row, so we unwrap it about the
+		#advance predicted by the speed rather than about zero.
+		advance = 0.5*(speed[:-1] + speed[1:]) * step
+		correction = np.mod(np.diff(V, axis=0) - advance + 180.0, 360.0) - 180.0
+		return V[0] + np.append(
+			np.zeros((1, V.shape[1])), np.cumsum(advance + correction, axis=0), axis=0
+		)
+
+	def save(self, path):
+		"""
+		Save the table to an uncompressed .npz file.
+		Arguments:
+		path -- file name
+		"""
+		np.savez(
+			path,
+			names = np.array(self.names),
+			start = np.array(self.start),
+			step = np.array(self.step),
+			V = self.V, speed = self.speed, u = self.u, f = self.f,
+			error = np.array([self.error[k] for k in ['V', 'speed', 'u', 'f']])
+		)
+
+	@classmethod
+	def load(cls, path, mmap = True):
+		"""
+		Load a table saved with NodalTable.save().
+		Arguments:
+		path -- file name
+		mmap -- whether to map the tables into memory read-only rather than read them (default: True)
+		"""
+		arrays = cls._memmap_npz(path) if mmap else dict(np.load(path))
+		error = dict(zip(['V', 'speed', 'u', 'f'], np.array(arrays['error'])))
+		return cls(
+			arrays['names'], arrays['start'][()], float(arrays['step']),
+			arrays['V'], arrays['speed'], arrays['u'], arrays['f'], error
+		)
+
+	@staticmethod
+	def _memmap_npz(path):
+		"""
+		Return a dictionary of read-only memory maps of the arrays stored in an
+		uncompressed .npz file.
+		"""
+		arrays = {}
+		with zipfile.ZipFile(path) as archive:
+			infos = archive.infolist()
+		with open(path, 'rb') as fh:
+			for info in infos:
+				if info.compress_type != zipfile.ZIP_STORED:
+					raise ValueError("Cannot map compressed member %s of %s." % (info.filename, path))
+				#Skip the zip local file header to reach the .npy data
+				fh.seek(info.header_offset)
+				header = fh.read(30)
+				name_length, extra_length = struct.unpack('<HH', header[26:30])
+				fh.seek(info.header_offset + 30 + name_length + extra_length)
+				version = np.lib.format.read_magic(fh)
+				if version == (1, 0):
+					shape, fortran, dtype = np.lib.format.read_array_header_1_0(fh)
+				else:
+					shape, fortran, dtype = np.lib.format.read_array_header_2_0(fh)
+				name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+				if not shape:
+					#Scalars are small, just read them
+					arrays[name] = np.frombuffer(fh.read(dtype.itemsize), dtype=dtype).reshape(())
+				else:
+					arrays[name] = np.memmap(
+						path, dtype=dtype, mode='r', shape=shape,
+						order='F' if fortran else 'C', offset=fh.tell()
+					)
+		return arrays
+
+	def _interpolate(self, tables, index, t):
+		#Linearly interpolate the columns index of each of tables (rows,
+		#constituents) to times t, returning arrays of shape (columns, times).
+		x = np.atleast_1d(Tide._hours(self.start, Tide._as_times(t))) / self.step
+		rows = len(tables[0])
+		if np.any(x < 0) or np.any(x > rows - 1):
+			raise ValueError("Times lie outside the range of the nodal table.")
+		j = np.minimum(np.floor(x).astype(int), rows - 2)
+		w = x - j
+		return [
+			(table[j][:, index] * (1.0 - w)[:, np.newaxis] + table[j + 1][:, index] * w[:, np.newaxis]).T
+			for table in tables
+		]
+
+	def prepare(self, constituents, t0, t = None, radians = True):
+		"""
+		Return constituent speed and equilibrium argument at a given time, and
+		constituent node factors at given times, interpolated from the table.
+		Arguments:
+		see Tide._prepare()
+		"""
+		try:
+			index = [self.index[c.name] for c in constituents]
+		except KeyError as e:
+			raise ValueError("Constituent %s is not in the nodal table." % e.args[0])
+		if isinstance(t0, (list, tuple, np.ndarray)) and np.ndim(t0):
+			t0 = t0[0]
+		if t is None:
+			t = [t0]
+		if not isinstance(t, (list, tuple, np.ndarray)):
+			t = [t]
+
+		V0, speed = self._interpolate([self.V, self.speed], index, [t0])
+		u, f = self._interpolate([self.u, self.f], index, t)
+
+		#For convenience give u, V0 (but not speed!) in [0, 360)
+		V0 = np.mod(V0, 360.0)
+		u = np.mod(u, 360.0)
+		u = [u[:, [i]] for i in range(len(t))]
+		f = [f[:, [i]] for i in range(len(t))]
+
+		if radians:
+			speed = d2r*speed
+			V0 = d2r*V0
+			u = [d2r*each for each in u]
+		return speed, u, f, V0
@@ -0,0 +1,129 @@
+import numpy as np
+
+class NormalEquations(object):
+	"""
+	Running sums for the linear least squares fit of constituent cosine and sine
+	coefficients to tidal heights. With u, f and V0 held fixed the tidal series
+		sum H f cos(speed t + V0 + u - p)
+	is linear in (H cos p, H sin p), so the fit is determined entirely by the
+	sums X X^T, X y, sum(X), sum(y), sum(y^2) and the number of observations,
+	where X is the design matrix of Tide._design. These can be accumulated one
+	block of observations at a time.
+	"""
+
+	def __init__(self, n, k = 1):
+		"""
+		Arguments:
+		n -- number of constituents
+		k -- number of height series fitted simultaneously (default: 1)
+		"""
+		self.n, self.k = n, k
+		self.XX = np.zeros((2*n, 2*n))
+		self.Xy = np.zeros((2*n, k))
+		self.X  = np.zeros(2*n)
+		self.y  = np.zeros(k)
+		self.yy = np.zeros(k)
+		self.count = 0
+
+	def add(self, X, y, sign = 1.0):
+		"""
+		Add a block of observations to the sums.
+		Arguments:
+		X -- design matrix of shape (2n, N)
+		y -- heights, of shape (N,) or (N, k)
+		sign -- use -1.0 to remove observations previously added (default: 1.0)
+		"""
+		y = np.asarray(y, dtype=float).reshape(X.shape[1], self.k)
+		self.XX += sign * np.dot(X, X.T)
+		self.Xy += sign * np.dot(X, y)
+		self.X  += sign * np.sum(X, axis=1)
+		self.y  += sign * np.sum(y, axis=0)
+		self.yy += sign * np.sum(y*y, axis=0)
+		self.count += int(sign) * len(y)
+
+	def remove(self, X, y):
+		"""
+		Remove a block of observations from the sums.
+		Arguments:
+		see NormalEquations.add()
+		"""
+		self.add(X, y, sign = -1.0)
+
+	def subset(self, indices):
+		"""
+		Return the normal equations restricted to a subset of the constituents.
+		Arguments:
+		indices -- indices of the constituents to retain
+		"""
+		indices = np.asarray(indices, dtype=int)
+		rows = np.append(indices, indices + self.n)
+		sub = NormalEquations(len(indices), self.k)
+		sub.XX = self.XX[np.ix_(rows, rows)]
+		sub.Xy = self.Xy[rows]
+		sub.X  = self.X[rows]
+		sub.y, sub.yy, sub.count = self.y.copy(), self.yy.copy(), self.count
+		return sub
+
+	def mean(self):
+		"""
+		Return the mean of the heights (one value per series).
+		"""
+		return self.y / self.count
+
+	def solve(self, centre = True):
+		"""
+		Return the least squares coefficients and their unscaled covariance.
+		Arguments:
+		centre -- whether to fit a constant level (see intercept()) together with
+		          the constituents, by fitting the heights relative to their mean,
+		          rather than none (default: True)
+		Returns (c, cov, rss, rank) where c has shape (2n, k), holding the cosine
+		coefficients H cos p in its first n rows and the sine coefficients
+		H sin p in the rest; cov is (X X^T)^-1, which should be multiplied by
+		the residual variance to give the covariance of c; rss is the residual
+		sum of squares of each series (about the fitted level, if centred) and
+		rank the rank of the problem.
+		"""
+		XX, Xy, yy = self.XX, self.Xy, self.yy
+		if centre and self.count:
+			mean = self.mean()
+			XX = XX - np.outer(self.X, self.X) / self.count
+			Xy = Xy - np.outer(self.X, mean)
+			yy = yy - self.count * mean**2
+		cov = np.linalg.pinv(XX)
+		c = np.dot(cov, Xy)
+		rss = yy - np.sum(c * Xy, axis=0)
+		return c, cov, np.maximum(rss, 0.0), np.linalg.matrix_rank(XX)
+
+	def intercept(self, c):
+		"""
+		Return the constant level fitted together with coefficients c by a
+		centred solve() (one value per series): the mean of the heights less
+		the mean of the fitted series.
+		"""
+		return (self.y - np.dot(self.X, c)) / self.count
+
+def polar(c, cov = None):
+	"""
+	Convert cosine and sine coefficients into amplitudes and phases (radians).
+	Arguments:
+	c -- array of shape (2n,) or (2n, k) as returned by NormalEquations.solve()
+	cov -- optional covariance of c (for a single series), which is then
+	       transformed to the covariance of (amplitudes, phases).
+	Returns (amplitudes, phases) or (amplitudes, phases, covariance).
+	"""
+	n = len(c) // 2
+	a, b = c[:n], c[n:]
+	amplitudes = np.hypot(a, b)
+	phases = np.arctan2(b, a)
+	if cov is None:
+		return amplitudes, phases
+	a, b = a.reshape(n), b.reshape(n)
+	H2 = np.where(amplitudes.reshape(n) > 0, amplitudes.reshape(n)**2, np.inf)
+	#Jacobian of (amplitudes, phases) with respect to (a, b)
+	J = np.zeros((2*n, 2*n))
+	J[np.arange(n), np.arange(n)] = a / np.sqrt(H2)
+	J[np.arange(n), n + np.arange(n)] = b / np.sqrt(H2)
+	J[n + np.arange(n), np.arange(n)] = -b / H2
+	J[n + np.arange(n), n + np.arange(n)] = a / H2
+	return amplitudes, phases, np.dot(J, np.dot(cov, J.T))
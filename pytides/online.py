@@ -0,0 +1,110 @@
+import numpy as np
+from tide import Tide, d2r
+from normal_equations import polar
+import constituent
+
+class OnlineTide(object):
+	"""
+	A tidal model updated by recursive least squares as observations arrive,
+	starting from an existing Tide, so that it can be kept current from a live
+	feed without refitting the whole history.
+
+	The state is the cosine and sine coefficients (H cos p, H sin p) of each
+	constituent together with the mean level z0, and the matrix P (the inverse
+	of the weighted normal matrix). Each observation updates both with O(n^2)
+	work. With a forgetting factor below 1 the weight of past observations
+	decays geometrically, so the model tracks slow changes; with 1 (the
+	default) the result approaches the least squares fit of all observations.
+
+	Since the coefficients are relative to Greenwich phases they don't depend
+	on any reference time, so the speed, equilibrium argument and node factors
+	are prepared afresh for each 240 hour partition (counted from the unix
+	epoch) that observations fall in.
+	"""
+
+	epoch = np.datetime64('1970-01-01T00:00:00', 'us')
+
+	def __init__(self, tide, weight = 1.0, forgetting = 1.0, partition = 240.0):
+		"""
+		Arguments:
+		tide -- Tide from which to start
+		weight -- weight of the starting model, roughly the number of observations it is worth (default: 1.0)
+		forgetting -- factor by which the weight of past observations decays with each observation, in (0, 1] (default: 1.0)
+		partition -- number of hours for which the node factors are considered constant (default: 240.0)
+		"""
+		if not 0 < forgetting <= 1:
+			raise ValueError("forgetting must be in (0, 1].")
+		if not weight > 0:
+			raise ValueError("weight must be positive.")
+		self.constituents = [c for c in tide.model['constituent'] if not c == constituent._Z0]
+		self.table = tide.table
+		self.forgetting = float(forgetting)
+		self.partition = float(partition)
+		n = len(self.constituents)
+
+		#Coefficients (H cos p, H sin p, z0)
+		self.c = np.zeros(2*n + 1)
+		i = 0
+		for c, amplitude, phase in tide.model:
+			if c == constituent._Z0:
+				self.c[-1] += amplitude * np.cos(d2r*phase)
+			else:
+				self.c[i] = amplitude * np.cos(d2r*phase)
+				self.c[n + i] = amplitude * np.sin(d2r*phase)
+				i += 1
+		#Each observation contributes about 1/2 to the diagonal of the normal
+		#matrix of the harmonic terms (and 1 to that of z0)
+		self.P = np.diag(np.append(2.0*np.ones(2*n), 1.0)) / weight
+		self.count = 0
+		self._node = None
+
+	def _regressors(self, k, hours):
+		#Rows (f cos(speed t + V0 + u), f sin(...), 1) for hours within partition k
+		if self._node is None or self._node[0] != k:
+			start = Tide._times(self.epoch, k * self.partition)
+			speed, [u], [f], V0 = Tide._prepare(
+				self.constituents, start, [Tide._times(start, 0.5*self.partition)],
+				radians = True, table = self.table
+			)
+			self._node = (k, speed, u, f, V0)
+		_, speed, u, f, V0 = self._node
+		X = Tide._design(hours - k * self.partition, speed, u, f, V0)
+		return np.append(X, np.ones((1, X.shape[1])), axis=0).T
+
+	def update(self, t, heights):
+		"""
+		Update the model with new observations.
+		Arguments:
+		t -- time (or array of times: datetimes, datetime64 or seconds since the unix epoch) of the observations, in order
+		heights -- observed height (or array of heights)
+		"""
+		t = np.atleast_1d(Tide._datetime64(Tide._as_times(t)))
+		heights = np.atleast_1d(np.asarray(heights, dtype=float))
+		if len(t) != len(heights):
+			raise ValueError("Expected one height per time.")
+		hours = Tide._hours(self.epoch, t)
+		k = np.floor(hours / self.partition).astype(int)
+		edges = np.flatnonzero(np.diff(k)) + 1
+		for a, b in zip(np.append(0, edges), np.append(edges, len(k))):
+			X = self._regressors(k[a], hours[a:b])
+			for x, y in zip(X, heights[a:b]):
+				Px = np.dot(self.P, x)
+				gain = Px / (self.forgetting + np.dot(x, Px))
+				self.c += gain * (y - np.dot(x, self.c))
+				self.P -= np.outer(gain, Px)
+				self.P = 0.5*(self.P + self.P.T) / self.forgetting
+			self.count += b - a
+
+	@property
+	def tide(self):
+		"""
+		The current model as a Tide.
+		"""
+		n = len(self.constituents)
+		amplitudes, phases = polar(self.c[:-1])
+		model = np.zeros(1+n, dtype=Tide.dtype)
+		model[0] = (constituent._Z0, self.c[-1], 0)
+		model[1:]['constituent'] = self.constituents[:]
+		model[1:]['amplitude'] = amplitudes
+		model[1:]['phase'] = phases
+		return Tide(model = model, radians = True, table = self.table)
@@ -0,0 +1,111 @@
+import numpy as np
+
+class PartitionIndex(object):
+	"""
+	An index of a series of hours into consecutive partitions of fixed length,
+	built once in O(N) (counting the samples in each partition rather than
+	scanning the whole series for every partition), which then hands out each
+	partition's samples as views.
+
+	Partition i holds the hours h with
+		first + i <= (h - origin) / partition < first + i + 1
+	where first is the number of the partition holding the earliest sample, so
+	with the default origin (the earliest sample) first is 0.
+
+	Samples which are already in order are never copied. Samples which aren't
+	are either sorted once (so partitions are still views of index.hours, and
+	sort() arranges other arrays the same way) or, with keep_order, left where
+	they are, in which case positions() gives the indices (in time order) of
+	each partition's samples in the original arrays, for instance to write
+	results in place.
+	"""
+
+	def __init__(self, hours, partition = 240.0, origin = None, keep_order = False):
+		"""
+		Arguments:
+		hours -- array of hours
+		partition -- length of each partition in hours (default: 240.0)
+		origin -- hour at which partitions are counted from (default: the earliest of hours)
+		keep_order -- whether to leave unsorted hours in their original order rather than sort them (default: False)
+		"""
+		hours = np.asarray(hours, dtype=float)
+		self.partition = float(partition)
+		self.keep_order = keep_order
+		if not len(hours):
+			self.origin = 0.0 if origin is None else float(origin)
+			self.first, self.order, self.hours = 0, None, hours
+			self.bounds = np.zeros(1, dtype=int)
+			return
+		self.origin = float(np.amin(hours) if origin is None else origin)
+		key = np.floor((hours - self.origin) / self.partition).astype(int)
+		self.first = key.min()
+		key -= self.first
+
+		#Samples out of order within a partition need sorting too, since
+		#index.hours is sorted
+		if np.all(hours[1:] >= hours[:-1]):
+			self.order = None
+		else:
+			self.order = np.argsort(hours, kind='mergesort')
+		self.hours = hours if self.order is None or keep_order else hours[self.order]
+		self.bounds = np.append(0, np.cumsum(np.bincount(key)))
+
+	def __len__(self):
+		return len(self.bounds) - 1
+
+	def __getitem__(self, i):
+		return self.take(self.hours, i)
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self[i]
+
+	def numbers(self):
+		"""
+		Return the number of each partition counted from the origin.
+		"""
+		return self.first + np.arange(len(self))
+
+	def midpoints(self):
+		"""
+		Return the hour at the middle of each partition.
+		"""
+		return self.origin + (self.numbers() + 0.5) * self.partition
+
+	def counts(self):
+		"""
+		Return the number of samples in each partition.
+		"""
+		return np.diff(self.bounds)
+
+	def positions(self, i):
+		"""
+		Return the positions of the samples of partition i in arrays arranged
+		as index.hours: a slice, except for unsorted samples kept in order.
+		"""
+		a, b = self.bounds[i], self.bounds[i+1]
+		if self.order is not None and self.keep_order:
+			return self.order[a:b]
+		return slice(a, b)
+
+	def take(self, values, i):
+		"""
+		Return the values of partition i of an array arranged as index.hours.
+		"""
+		return values[self.positions(i)]
+
+	def split(self, values):
+		"""
+		Return a list of the values of every partition of an array arranged
+		as index.hours.
+		"""
+		return [self.take(values, i) for i in range(len(self))]
+
+	def sort(self, values):
+		"""
+		Arrange an array, given in the order of the original hours, as
+		index.hours are arranged.
+		"""
+		if self.order is None or self.keep_order:
+			return values
+		return values[self.order]
@@ -0,0 +1,101 @@
+import numpy as np
+
+class PhasorSeries(object):
+	"""
+	Evaluate the tidal series
+		sum A f cos(speed t + V0 + u - p)
+	on uniformly spaced times by rotating each constituent's phasor, rather
+	than evaluating a cosine for every constituent at every time.
+
+	The cosines and sines of speed*step*j for j < block are tabulated once, so
+	a block of samples is two matrix products with the block's anchor phasors.
+	Each block is re-anchored by evaluating its first phasors exactly, so
+	rounding errors never accumulate beyond a single rotation: the absolute
+	error of each height is a small multiple of machine epsilon times sum(A f),
+	in addition to the error in speed*t which direct evaluation shares.
+
+	The series is also a stream: seek() positions it (and sets the node factors
+	of the current partition) and next() returns successive blocks of heights.
+	"""
+
+	def __init__(self, amplitude, phase, speed, V0, step, block = 1024):
+		"""
+		Arguments:
+		amplitude -- constituent amplitudes
+		phase -- constituent phases (radians)
+		speed -- constituent speeds (radians per hour)
+		V0 -- constituent equilibrium arguments (radians)
+		step -- spacing of the samples (hours)
+		block -- number of samples per block (default: 1024)
+		"""
+		self.amplitude = np.ravel(amplitude)
+		self.phase = np.ravel(phase)
+		self.speed = np.ravel(speed)
+		self.V0 = np.ravel(V0)
+		self.step = float(step)
+		self.block = block
+		rotation = np.outer(self.speed, self.step * np.arange(block))
+		self.cos, self.sin = np.cos(rotation), np.sin(rotation)
+		self.t = 0.0
+		self.u, self.f = 0.0, 1.0
+
+	def seek(self, t, u = None, f = None):
+		"""
+		Set the time of the next sample and optionally the node factors.
+		Arguments:
+		t -- hours of the next sample
+		u -- node factors u (radians) to use from here on
+		f -- node factors f to use from here on
+		"""
+		self.t = float(t)
+		if u is not None:
+			self.u = np.ravel(u)
+		if f is not None:
+			self.f = np.ravel(f)
+
+	def next(self, count, out = None):
+		"""
+		Return the heights of the next count samples, advancing the series.
+		Arguments:
+		count -- number of samples
+		out -- optional array of length count in which to write the heights
+		"""
+		if out is None:
+			out = np.empty(count)
+		scale = self.amplitude * self.f
+		offset = self.V0 + self.u - self.phase
+		for i in range(0, count, self.block):
+			m = min(self.block, count - i)
+			anchor = self.speed * (self.t + i*self.step) + offset
+			out[i:i+m] = (
+				np.dot(scale * np.cos(anchor), self.cos[:, :m])
+				- np.dot(scale * np.sin(anchor), self.sin[:, :m])
+			)
+		self.t += count * self.step
+		return out
+
+	def next_derivatives(self, count, order, out = None):
+		"""
+		Return the heights of the next count samples and their first order
+		time derivatives (per hour) as an array of shape (order+1, count),
+		advancing the series. The node factors are taken to be constant.
+		Arguments:
+		count -- number of samples
+		order -- highest derivative
+		out -- optional array of shape (order+1, count) in which to write them
+		"""
+		if out is None:
+			out = np.empty((order + 1, count))
+		#The kth derivative of cos(speed t + a) is speed^k cos(speed t + a + k pi/2)
+		k = np.arange(order + 1)[:, np.newaxis]
+		scale = self.speed**k * (self.amplitude * self.f)
+		offset = self.V0 + self.u - self.phase + 0.5*np.pi*k
+		for i in range(0, count, self.block):
+			m = min(self.block, count - i)
+			anchor = self.speed * (self.t + i*self.step) + offset
+			out[:, i:i+m] = (
+				np.dot(scale * np.cos(anchor), self.cos[:, :m])
+				- np.dot(scale * np.sin(anchor), self.sin[:, :m])
+			)
+		self.t += count * self.step
+		return out
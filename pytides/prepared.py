@@ -0,0 +1,195 @@
+from collections import OrderedDict
+import numpy as np
+from astro import astro
+from tide import Tide, d2r
+from phasor import PhasorSeries
+from partition import PartitionIndex
+import constituent
+
+class PreparedTide(Tide):
+	"""
+	A Tide which remembers its nodal preparation (speed, u, f and V0) between
+	calls, for services which repeatedly ask for overlapping predictions.
+
+	at() works on a fixed grid of partitions counted from the unix epoch, and
+	caches each partition's speed and V0 (at the partition's start) and u and f
+	(at its midpoint) keyed by the partition's start, so that any later query
+	touching the same partition reuses them. (Since Tide.at() counts its
+	partitions from the first time asked for instead, the two agree exactly on
+	queries starting at a partition boundary, and otherwise to within the error
+	of holding the node factors constant over a partition.) Other calls to prepare() (as made
+	by extrema() and stream()) are cached keyed by their arguments. The cache
+	holds at most maxsize entries, evicting the least recently used, and counts
+	its hits and misses.
+
+	The cached values depend only on the model's constituents and nodal table;
+	the cache is invalidated automatically when they change, or explicitly by
+	invalidate().
+	"""
+
+	epoch = np.datetime64('1970-01-01T00:00:00', 'us')
+
+	def __init__(
+			self,
+			constituents = None,
+			amplitudes = None,
+			phases = None,
+			model = None,
+			radians = False,
+			table = None,
+			maxsize = 1024,
+			partition = 240.0
+		):
+		"""
+		Initialise a prepared tidal model.
+		Arguments:
+		see Tide.__init__()
+		maxsize -- maximum number of cached preparations (default: 1024)
+		partition -- number of hours for which at() considers the node factors to be constant (default: 240.0)
+		"""
+		self.maxsize = maxsize
+		self.partition = float(partition)
+		self.cache = OrderedDict()
+		self.hits = self.misses = 0
+		self._constituents = None
+		super(PreparedTide, self).__init__(
+			constituents, amplitudes, phases, model, radians, table
+		)
+
+	@property
+	def model(self):
+		return self._model
+
+	@model.setter
+	def model(self, model):
+		self._model = model
+		self.invalidate()
+
+	@property
+	def table(self):
+		return self._table
+
+	@table.setter
+	def table(self, table):
+		self._table = table
+		self.invalidate()
+
+	def invalidate(self):
+		"""
+		Discard all cached preparations.
+		"""
+		self.cache.clear()
+		self._constituents = None
+
+	def _check(self):
+		#Invalidate the cache if the constituents have changed in place
+		constituents = tuple(id(c) for c in self.model['constituent'])
+		if constituents != self._constituents:
+			self.invalidate()
+			self._constituents = constituents
+
+	def _get(self, key):
+		if key in self.cache:
+			self.hits += 1
+			value = self.cache.pop(key)
+			self.cache[key] = value
+			return value
+		self.misses += 1
+		return None
+
+	def _put(self, key, value):
+		self.cache[key] = value
+		while len(self.cache) > self.maxsize:
+			self.cache.popitem(last = False)
+
+	def prepare(self, t0, t = None, radians = True, table = None):
+		"""
+		As Tide.prepare(), but cached.
+		"""
+		if table is None:
+			table = self.table
+		self._check()
+		times = None if t is None else tuple(np.atleast_1d(t).tolist())
+		key = ('prepare', t0, times, radians, id(table))
+		value = self._get(key)
+		if value is None:
+			value = super(PreparedTide, self).prepare(t0, t, radians = radians, table = table)
+			self._put(key, value)
+		return value
+
+	def _partitions(self, k):
+		"""
+		Return (speed, u, f, V0) in radians, each of shape (n, len(k)), for the
+		partitions numbered k, from the cache where possible.
+		"""
+		self._check()
+		k = np.asarray(k, dtype=int)
+		prepared = [self._get(('partition', j)) for j in k]
+		missing = [i for i, value in enumerate(prepared) if value is None]
+		if missing:
+			start = self.epoch + (k[missing] * self.partition * 3.6e9).astype('int64').astype('timedelta64[us]')
+			middle = start + np.timedelta64(int(0.5 * self.partition * 3.6e9), 'us')
+			constituents = constituent.ConstituentSet(self.model['constituent'])
+			if self.table is not None:
+				#The table gives V0 and speed at one time per call
+				values = [self.table.prepare(constituents, s, [m]) for s, m in zip(start, middle)]
+				values = [(s[:, 0], u[:, 0], f[:, 0], V0[:, 0]) for s, [u], [f], V0 in values]
+			else:
+				a, b = astro(start), astro(middle)
+				speed, V0 = d2r*constituents.speed(a), d2r*np.mod(constituents.V(a), 360.0)
+				u, f = d2r*np.mod(constituents.u(b), 360.0), constituents.f(b)
+				values = [(speed[:, i], u[:, i], f[:, i], V0[:, i]) for i in range(len(start))]
+			for i, value in zip(missing, values):
+				prepared[i] = value
+				self._put(('partition', k[i]), value)
+		return [np.array(each).T for each in zip(*prepared)]
+
+	def at(self, t, node_tolerance = None, derivatives = 0, workers = None):
+		"""
+		Return the modelled tidal height at given times.
+		Arguments:
+		t -- array of times (datetimes, datetime64 or seconds since the unix epoch) at which to evaluate the tidal height
+		node_tolerance -- see Tide.at() (interpolated node factors aren't cached)
+		derivatives -- see Tide.at()
+		workers -- see Tide.at()
+		"""
+		if node_tolerance is not None:
+			return super(PreparedTide, self).at(t, node_tolerance, derivatives, workers)
+		if derivatives not in (0, 1, 2):
+			raise ValueError("derivatives must be 0, 1 or 2.")
+		t = Tide._as_times(t)
+		hours = np.atleast_1d(Tide._hours(self.epoch, t))
+		index = PartitionIndex(hours, self.partition, origin = 0.0, keep_order = True)
+		partitions = index.numbers()[index.counts() > 0]
+		speed, u, f, V0 = self._partitions(partitions)
+		H = self.model['amplitude']
+		p = d2r*self.model['phase']
+
+		out = np.empty((derivatives + 1, len(hours)))
+		heights = out[0]
+
+		def evaluate(items):
+			for i, j in items:
+				where = index.positions(j - index.first)
+				t_i = hours[where] - j * self.partition
+				step = Tide._uniform_step(t_i)
+				if step and isinstance(where, slice):
+					series = PhasorSeries(H, p, speed[:, i], V0[:, i], step, block = min(1024, len(t_i)))
+					series.seek(t_i[0], u[:, i], f[:, i])
+					if derivatives:
+						series.next_derivatives(len(t_i), derivatives, out[:, where])
+					else:
+						series.next(len(t_i), heights[where])
+				elif derivatives:
+					out[:, where] = Tide._tidal_derivatives(
+						t_i, H[:, np.newaxis], p[:, np.newaxis], speed[:, [i]],
+						u[:, [i]], f[:, [i]], V0[:, [i]], derivatives
+					)
+				else:
+					heights[where] = Tide._tidal_series(
+						t_i, H[:, np.newaxis], p[:, np.newaxis], speed[:, [i]],
+						u[:, [i]], f[:, [i]], V0[:, [i]]
+					)
+
+		Tide._threaded(evaluate, list(enumerate(partitions)), workers)
+		return tuple(out) if derivatives else heights
@@ -0,0 +1,108 @@
+from datetime import timedelta
+import numpy as np
+from tide import Tide, r2d
+from partition import PartitionIndex
+from normal_equations import NormalEquations, polar
+import constituent
+
+def running_decompose(
+		heights,
+		window,
+		step,
+		t            = None,
+		t0           = None,
+		interval     = None,
+		constituents = constituent.noaa,
+		n_period     = 2,
+		table        = None
+	):
+	"""
+	Fit constituents to a sliding window of tidal observations, returning
+	their amplitudes and phases as time series.
+
+	The linear method of Tide.decompose() is applied to each window, but the
+	normal equations are updated as observations enter and leave the window
+	rather than rebuilt, so the cost is proportional to the length of the
+	record, not to the number of windows times their length. For this the
+	equilibrium arguments and speeds of every window are taken at the start of
+	the record (t0), as they are for any single decomposition, so phases are
+	comparable between windows.
+
+	Arguments:
+	heights -- ndarray of tidal observation heights
+	window -- length of each window in hours (or a timedelta)
+	step -- hours (or a timedelta) between the starts of successive windows
+	t, t0, interval -- observation times, see Tide.decompose()
+	constituents -- list of constituents to use in the fit (default: constituent.noaa)
+	n_period -- only include constituents which complete at least this many periods in a window (default: 2)
+	table -- optional NodalTable to use for node factors
+
+	Returns (times, constituents, amplitudes, phases, z0): the middle time of
+	each window (datetimes if t0 is a datetime, otherwise datetime64), the
+	constituents fitted, arrays of shape (windows, constituents) of their
+	amplitudes and phases (degrees), and the mean level of each window
+	(fitted together with the constituents).
+	Windows holding too few observations to determine the fit give nan.
+	"""
+	if isinstance(window, timedelta):
+		window = window.total_seconds() / 3600.0
+	if isinstance(step, timedelta):
+		step = step.total_seconds() / 3600.0
+	window, step = float(window), float(step)
+	if not (window > 0 and step > 0):
+		raise ValueError("window and step must be positive.")
+
+	heights = np.asarray(heights, dtype=float)
+	t0, hours = Tide._observation_hours(len(heights), t, t0, interval)
+
+	constituents = Tide._select_constituents(constituents, t0, window, n_period)
+	n = len(constituents)
+
+	#Node factors are held constant over 240 hour partitions, as by decompose
+	index = PartitionIndex(hours, 240.0)
+	hours, heights = index.hours, index.sort(heights)
+	times = Tide._times(t0, index.midpoints())
+	speed, u, f, V0 = Tide._prepare(constituents, t0, times, radians = True, table = table)
+
+	def design(a, b):
+		#Design matrix of the (sorted) observations a to b
+		first = np.searchsorted(index.bounds, a, side='right') - 1
+		last = np.searchsorted(index.bounds, b, side='left')
+		return np.concatenate([np.zeros((2*n, 0))] + [
+			Tide._design(
+				hours[max(a, index.bounds[k]):min(b, index.bounds[k+1])],
+				speed, u[k], f[k], V0
+			)
+			for k in range(first, last)
+		], axis=1)
+
+	starts = hours[0] + step * np.arange(int(np.floor((hours[-1] - hours[0] - window) / step)) + 1)
+	lower = np.searchsorted(hours, starts, side='left')
+	upper = np.searchsorted(hours, starts + window, side='left')
+
+	amplitudes = np.nan * np.ones((len(starts), n))
+	phases = np.nan * np.ones((len(starts), n))
+	z0 = np.nan * np.ones(len(starts))
+	equations = NormalEquations(n)
+	a = b = 0
+	for i, (lo, hi) in enumerate(zip(lower, upper)):
+		if lo >= b:
+			#The window doesn't overlap the last, so start afresh (this also
+			#stops rounding errors accumulating over long records)
+			equations = NormalEquations(n)
+			a = b = lo
+		if hi > b:
+			equations.add(design(b, hi), heights[b:hi])
+		if lo > a:
+			equations.remove(design(a, lo), heights[a:lo])
+		a, b = lo, hi
+		if equations.count <= 2*n:
+			continue
+		c, _, _, rank = equations.solve(centre = True)
+		if rank < 2*n:
+			continue
+		amplitudes[i], phases[i] = polar(c[:, 0])
+		z0[i] = equations.intercept(c)[0]
+
+	times = Tide._times(t0, starts + 0.5*window)
+	return times, constituents, amplitudes, np.mod(r2d*phases, 360.0), z0
@@ -0,0 +1,120 @@
+import numpy as np
+from tide import Tide
+from nodal_table import NodalTable
+from collection import TideCollection
+import constituent
+
+class ModelStore(object):
+	"""
+	The models of many stations in one file, held as numeric arrays (see
+	Tide.numeric()) so that the file can be memory mapped and shared between
+	processes, and models loaded without unpickling.
+
+	A store is an uncompressed .npz file holding
+	stations -- the station ids, sorted so that a station is found by binary search
+	offsets -- the rows of models belonging to each station are offsets[i] to offsets[i+1]
+	models -- every station's model, as an array of Tide.numeric_dtype
+	names -- the names of the constituents referred to by the models' ids
+	Since the file records the name of each constituent id, it doesn't depend
+	on the order in which constituents were registered when it was written.
+	"""
+
+	def __init__(self, stations, offsets, models, names):
+		"""
+		Arguments:
+		see ModelStore
+		"""
+		self.stations = stations
+		self.offsets = offsets
+		self.models = models
+		self.names = [str(name) for name in names]
+		#Constituent ids of the file to those of the registry
+		self._ids = np.array([constituent.named(name) for name in self.names], dtype=int)
+
+	@classmethod
+	def save(cls, path, tides, stations):
+		"""
+		Write a store of models to an uncompressed .npz file.
+		Arguments:
+		path -- file name
+		tides -- list of Tides
+		stations -- list of station ids (strings or integers), one per Tide
+		"""
+		stations = [str(station) for station in stations]
+		if len(stations) != len(tides):
+			raise ValueError("Expected one station id per Tide.")
+		if len(set(stations)) != len(stations):
+			raise ValueError("Station ids must be unique.")
+		order = sorted(range(len(stations)), key = lambda i: stations[i])
+		models = [tides[i].numeric() for i in order]
+
+		#Only the constituents used are named in the file
+		used = np.unique(np.concatenate([m['constituent'] for m in models] + [np.zeros(0, dtype=int)]))
+		position = dict((j, i) for i, j in enumerate(used))
+		for m in models:
+			m['constituent'] = [position[j] for j in m['constituent']]
+
+		np.savez(
+			path,
+			stations = np.array([stations[i] for i in order], dtype=bytes),
+			offsets = np.append(0, np.cumsum([len(m) for m in models])).astype('<i8'),
+			models = np.concatenate([m for m in models] + [np.zeros(0, dtype=Tide.numeric_dtype)]),
+			names = np.array([constituent.registry[j].name for j in used], dtype=bytes)
+		)
+
+	@classmethod
+	def load(cls, path, mmap = True):
+		"""
+		Open a store written by ModelStore.save().
+		Arguments:
+		path -- file name
+		mmap -- whether to map the models into memory read-only rather than read them (default: True)
+		"""
+		arrays = NodalTable._memmap_npz(path) if mmap else dict(np.load(path))
+		names = [name if isinstance(name, str) else name.decode() for name in arrays['names']]
+		return cls(arrays['stations'], arrays['offsets'], arrays['models'], names)
+
+	def __len__(self):
+		return len(self.stations)
+
+	def __iter__(self):
+		for station in self.stations:
+			yield station if isinstance(station, str) else station.decode()
+
+	def __contains__(self, station):
+		return self._find(station) is not None
+
+	def _find(self, station):
+		#Keys longer than the stored ids are truncated, so we check the match
+		station = str(station)
+		i = np.searchsorted(self.stations, np.array(station).astype(self.stations.dtype))
+		if i < len(self.stations):
+			found = self.stations[i]
+			if (found if isinstance(found, str) else found.decode()) == station:
+				return i
+		return None
+
+	def model(self, station):
+		"""
+		Return a station's model as an array of Tide.numeric_dtype, with
+		constituent ids of constituent.registry.
+		Arguments:
+		station -- station id
+		"""
+		i = self._find(station)
+		if i is None:
+			raise KeyError(station)
+		model = np.array(self.models[self.offsets[i]:self.offsets[i+1]])
+		model['constituent'] = self._ids[model['constituent']]
+		return model
+
+	def __getitem__(self, station):
+		return Tide.from_numeric(self.model(station))
+
+	def collection(self, stations = None):
+		"""
+		Return a TideCollection of the models of the given stations (default: all of them).
+		"""
+		if stations is None:
+			stations = list(self)
+		return TideCollection([self[station] for station in stations])
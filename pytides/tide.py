@@ -8,8 +8,11 @@ except ImportError: #Python3
 	ifilter = filter
 from datetime import datetime, timedelta
 import numpy as np
-from scipy.optimize import leastsq, fsolve
 from astro import astro
+from normal_equations import NormalEquations, polar
+from phasor import PhasorSeries
+from partition import PartitionIndex
+import instrument
 import constituent
 
 d2r, r2d = np.pi/180.0, 180.0/np.pi
@@ -20,13 +23,21 @@ class Tide(object):
 		('amplitude', float),
 		('phase', float)])
 
+	#A model with constituents referred to by their ids in constituent.registry,
+	#which can be saved, memory mapped and shared without pickling.
+	numeric_dtype = np.dtype([
+		('constituent', '<i4'),
+		('amplitude', '<f8'),
+		('phase', '<f8')])
+
 	def __init__(
 			self,
 			constituents = None,
 			amplitudes = None,
 			phases = None,
 			model = None,
-			radians = False
+			radians = False,
+			table = None
 		):
 		"""
 		Initialise a tidal model. Provide constituents, amplitudes and phases OR a model.
@@ -36,6 +47,7 @@ class Tide(object):
 		phases -- list of phases corresponding to constituents
 		model -- an ndarray of type Tide.dtype representing the constituents, amplitudes and phases.
 		radians -- boolean representing whether phases are in radians (default False)
+		table -- optional NodalTable from which to interpolate speeds, equilibrium arguments and node factors
 		"""
 		if None not in [constituents, amplitudes, phases]:
 			if len(constituents) == len(amplitudes) == len(phases):
@@ -53,41 +65,55 @@ class Tide(object):
 		if radians:
 			model['phase'] = r2d*model['phase']
 		self.model = model[:]
+		self.table = table
 		self.normalize()
 
 	def prepare(self, *args, **kwargs):
+		kwargs.setdefault('table', self.table)
 		return Tide._prepare(self.model['constituent'], *args, **kwargs)
 
 	@staticmethod
-	def _prepare(constituents, t0, t = None, radians = True):
+	def _prepare(constituents, t0, t = None, radians = True, table = None):
 		"""
 		Return constituent speed and equilibrium argument at a given time, and constituent node factors at given times.
 		Arguments:
-		constituents -- list of constituents to prepare
+		constituents -- list (or ConstituentSet) of constituents to prepare
 		t0 -- time at which to evaluate speed and equilibrium argument for each constituent
 		t -- list of times at which to evaluate node factors for each constituent (default: t0)
 		radians -- whether to return the angular arguments in radians or degrees (default: True)
+		table -- optional NodalTable from which to interpolate rather than evaluate the results
+		Times may be datetimes, datetime64 values or seconds since the unix epoch.
 		"""
+		if table is not None:
+			with instrument.stage('prepare.table', None if t is None else np.size(t)):
+				return table.prepare(constituents, t0, t, radians)
 		#The equilibrium argument is constant and taken at the beginning of the
 		#time series (t0).  The speed of the equilibrium argument changes very
 		#slowly, so again we take it to be constant over any length of data. The
 		#node factors change more rapidly.
 		if isinstance(t0, Iterable):
 			t0 = t0[0]
+		if not isinstance(t0, datetime):
+			t0 = Tide._datetime64(t0)
 		if t is None:
 			t = [t0]
 		if not isinstance(t, Iterable):
 			t = [t]
-		a0 = astro(t0)
-		a = [astro(t_i) for t_i in t]
+		if not isinstance(constituents, constituent.ConstituentSet):
+			constituents = constituent.ConstituentSet(constituents)
+		with instrument.stage('prepare.astro', len(t) + 1):
+			a0 = astro(t0)
+			#Evaluate the astronomical arguments for every time in t at once
+			a = astro(Tide._datetime64(t))
 
 		#For convenience give u, V0 (but not speed!) in [0, 360)
-		V0 = np.array([c.V(a0) for c in constituents])[:, np.newaxis]
-		speed = np.array([c.speed(a0) for c in constituents])[:, np.newaxis]
-		u = [np.mod(np.array([c.u(a_i) for c in constituents])[:, np.newaxis], 360.0)
-			 for a_i in a]
-		f = [np.mod(np.array([c.f(a_i) for c in constituents])[:, np.newaxis], 360.0)
-			 for a_i in a]
+		with instrument.stage('prepare.node', len(t) * len(constituents)):
+			V0 = constituents.V(a0)[:, np.newaxis]
+			speed = constituents.speed(a0)[:, np.newaxis]
+			u = np.mod(constituents.u(a), 360.0)
+			f = np.mod(constituents.f(a), 360.0)
+		u = [u[:, [i]] for i in range(len(t))]
+		f = [f[:, [i]] for i in range(len(t))]
 
 		if radians:
 			speed = d2r*speed
@@ -95,25 +121,305 @@ class Tide(object):
 			u = [d2r*each for each in u]
 		return speed, u, f, V0
 
-	def at(self, t):
+	@staticmethod
+	def _node_anchors(constituents, t0, first, last, tolerance, table = None):
+		"""
+		Return constituent speed and equilibrium argument (radians) at t0, and
+		node factors F = f exp(iu) at uniformly spaced anchor hours covering
+		first to last, spaced as widely as allows F to be linearly interpolated
+		between anchors to within tolerance, as (speed, V0, anchors, F, jumps).
+		A node factor whose phase jumps by 180 degrees (as u for M1 does when the
+		longitude of lunar perigee passes 90 or 270 degrees) has the sign of F
+		flipped after each jump, so that it too is interpolated to within
+		tolerance; jumps lists the (constituent, hour) of each jump, located to
+		the microsecond, for Tide._node_factors to flip it back.
+		Arguments:
+		constituents -- list (or ConstituentSet) of constituents to prepare
+		t0 -- time from which hours are counted
+		first -- first hour to be covered
+		last -- last hour to be covered
+		tolerance -- maximum error of the interpolated F (which bounds the error of the heights per unit amplitude)
+		table -- optional NodalTable from which to interpolate the anchors
+		"""
+		def evaluate(hours):
+			speed, u, f, V0 = Tide._prepare(
+				constituents, t0, Tide._times(t0, hours), radians = True, table = table
+			)
+			return speed, V0, np.concatenate(f, axis=1) * np.exp(1j*np.concatenate(u, axis=1))
+
+		#Node factors vary over years, so we start from anchors a year apart
+		#and halve the spacing until the error at the midpoints is small enough.
+		span = max(last - first, 0.0)
+		spacing = min(max(span, 24.0), 8766.0)
+		while True:
+			count = max(int(np.ceil(span / spacing)), 1)
+			#Anchors and the midpoints between them, in order
+			hours = first + 0.5*spacing * np.arange(2*count + 1)
+			speed, V0, F = evaluate(hours)
+			#Away from such jumps node factors turn by far less than 90 degrees
+			#between consecutive samples
+			jump = np.abs(np.angle(F[:, 1:] / F[:, :-1])) > 0.5*np.pi
+			raw = F.copy()
+			F[:, 1:] *= (-1.0) ** np.cumsum(jump, axis=1)
+			error = np.abs(0.5*(F[:, :-2:2] + F[:, 2::2]) - F[:, 1::2])
+			if np.all(error <= tolerance) or spacing <= 24.0:
+				break
+			spacing = max(0.5*spacing, 24.0)
+
+		#Bisect each jump down to consecutive microseconds from t0
+		rows, k = np.nonzero(jump)
+		low = np.round(hours[k] * 3.6e9).astype('int64')
+		high = np.round(hours[k + 1] * 3.6e9).astype('int64')
+		before = raw[rows, k]
+		while np.any(high - low > 1):
+			middle = (low + high) // 2
+			_, _, sample = evaluate(middle / 3.6e9)
+			late = np.abs(np.angle(sample[rows, np.arange(len(rows))] / before)) > 0.5*np.pi
+			high = np.where(late, middle, high)
+			low = np.where(late, low, middle)
+		jumps = list(izip(rows, high / 3.6e9))
+		return speed, V0, hours[::2], F[:, ::2], jumps
+
+	@staticmethod
+	def _node_factors(anchors, F, hours, jumps = ()):
+		"""
+		Return node factors u (radians) and f of shape (constituents, hours),
+		linearly interpolated between anchors (see Tide._node_anchors).
+		"""
+		x = (hours - anchors[0]) / (anchors[1] - anchors[0])
+		j = np.clip(np.floor(x).astype(int), 0, len(anchors) - 2)
+		w = x - j
+		F = F[:, j] * (1.0 - w) + F[:, j + 1] * w
+		for row, hour in jumps:
+			F[row, hours >= hour] *= -1.0
+		return np.angle(F), np.abs(F)
+
+	def at(self, t, node_tolerance = None, derivatives = 0, workers = None):
 		"""
 		Return the modelled tidal height at given times.
 		Arguments:
-		t -- array of times at which to evaluate the tidal height
+		t -- array of times (datetimes, datetime64 or seconds since the unix epoch) at which to evaluate the tidal height
+		node_tolerance -- if given, interpolate the node factors between anchors
+		                  spaced as widely as this tolerance allows (see
+		                  Tide._node_anchors) rather than hold them constant
+		                  over 240 hour partitions
+		derivatives -- 1 or 2 to also return the rate of change of the height
+		               (per hour) or the rate and its rate of change (per hour
+		               squared), computed in the same pass from the same node
+		               factors as the heights (default: 0)
+		workers -- optional number of threads over which to spread the
+		           partitions of the times, which lowers the latency of long
+		           predictions on several cores (default: evaluate in this thread)
+		Returns the heights, or if derivatives is given a tuple (heights, rate)
+		or (heights, rate, acceleration).
 		"""
+		if derivatives not in (0, 1, 2):
+			raise ValueError("derivatives must be 0, 1 or 2.")
+		t = Tide._as_times(t)
 		t0 = t[0]
-		hours = self._hours(t0, t)
+		hours = np.atleast_1d(self._hours(t0, t))
+		if node_tolerance is not None:
+			out = self._at_interpolated(t0, hours, node_tolerance, derivatives, workers)
+			return tuple(out) if derivatives else out[0]
 		partition = 240.0
-		t = self._partition(hours, partition)
-		times = self._times(t0, [(i + 0.5)*partition for i in range(len(t))])
-		speed, u, f, V0 = self.prepare(t0, times, radians = True)
+		#Heights are written in place, so times needn't be in order
+		with instrument.stage('at.partition', len(hours)):
+			index = PartitionIndex(hours, partition, keep_order = True)
+		times = self._times(t0, index.midpoints())
+		with instrument.stage('at.prepare', len(times)):
+			speed, u, f, V0 = self.prepare(t0, times, radians = True)
 		H = self.model['amplitude'][:, np.newaxis]
 		p = d2r*self.model['phase'][:, np.newaxis]
+		out = np.empty((derivatives + 1, len(hours)))
+		with instrument.stage('at.evaluate', len(hours) * len(H)):
+			Tide._evaluate(index, H, p, speed, u, f, V0, out, workers)
+		return tuple(out) if derivatives else out[0]
+
+	@staticmethod
+	def _evaluate(index, H, p, speed, u, f, V0, out, workers = None):
+		"""
+		Write the tidal series on the partitions of index (see Tide.at()) into
+		out, whose further rows (if any) receive its time derivatives.
+		Arguments:
+		index -- PartitionIndex of the times
+		H, p, speed, V0 -- amplitudes, phases, speeds and equilibrium arguments as columns
+		u, f -- node factors of each partition
+		out -- array of shape (order+1, len(index.hours))
+		workers -- optional number of threads over which to spread the partitions
+		"""
+		order = len(out) - 1
+		step = Tide._uniform_step(index.hours)
 
-		return np.concatenate([
-			Tide._tidal_series(t_i, H, p, speed, u_i, f_i, V0)
-			for t_i, u_i, f_i in izip(t, u, f)
-		])
+		def evaluate(partitions):
+			#Uniformly spaced times are evaluated by phasor rotation (see
+			#PhasorSeries), with a series for each thread
+			if step:
+				series = PhasorSeries(H, p, speed, V0, step, block = min(1024, len(index.hours)))
+			for i in partitions:
+				t_i = index[i]
+				if not len(t_i):
+					continue
+				where = index.positions(i)
+				if step:
+					series.seek(t_i[0], u[i], f[i])
+					if order:
+						series.next_derivatives(len(t_i), order, out[:, where])
+					else:
+						series.next(len(t_i), out[0, where])
+				elif order:
+					out[:, where] = Tide._tidal_derivatives(t_i, H, p, speed, u[i], f[i], V0, order)
+				else:
+					out[0, where] = Tide._tidal_series(t_i, H, p, speed, u[i], f[i], V0)
+
+		Tide._threaded(evaluate, list(range(len(index))), workers)
+		return out
+
+	@staticmethod
+	def _threaded(function, items, workers):
+		"""
+		Call function on contiguous runs of items, spread over a pool of
+		threads (or on all of them in this thread if workers is None or 1).
+		"""
+		if not workers or workers < 2 or len(items) < 2:
+			function(items)
+			return
+		#numpy releases the GIL while evaluating each partition, so threads
+		#writing to disjoint parts of the output run in parallel. Each thread
+		#takes a contiguous run of partitions, so its series is rarely
+		#re-anchored. ThreadPool is imported on first use, like scipy.
+		from multiprocessing.pool import ThreadPool
+		workers = min(workers, len(items))
+		bounds = np.linspace(0, len(items), workers + 1).astype(int)
+		pool = ThreadPool(workers)
+		try:
+			pool.map(function, [items[a:b] for a, b in izip(bounds[:-1], bounds[1:])])
+		finally:
+			pool.close()
+			pool.join()
+
+	def _at_interpolated(self, t0, hours, tolerance, derivatives = 0, workers = None):
+		"""
+		Return the modelled tidal height at hours since t0, and its first
+		derivatives (see Tide.at()) as an array of shape (derivatives+1, N),
+		interpolating the node factors between anchors.
+		"""
+		with instrument.stage('at.anchors'):
+			speed, V0, anchors, F, jumps = Tide._node_anchors(
+				self.model['constituent'], t0, np.amin(hours), np.amax(hours), tolerance, self.table
+			)
+		H = self.model['amplitude'][:, np.newaxis]
+		p = d2r*self.model['phase'][:, np.newaxis]
+		spacing = anchors[1] - anchors[0]
+		with instrument.stage('at.partition', len(hours)):
+			index = PartitionIndex(hours, spacing, origin = anchors[0], keep_order = True)
+		out = np.empty((derivatives + 1, len(hours)))
+		step = Tide._uniform_step(hours)
+		numbers = index.numbers()
+		#Partitions holding a jump in a node factor (see Tide._node_anchors)
+		#are evaluated directly; elsewhere F takes the sign of its partition.
+		jumped, sign = set(), np.ones(F.shape)
+		for row, hour in jumps:
+			for side in ('left', 'right'):
+				jumped.add(min(max(np.searchsorted(anchors, hour, side) - 1, 0), len(anchors) - 2))
+			sign[row, anchors >= hour] *= -1.0
+
+		def evaluate(partitions):
+			if step:
+				series = PhasorSeries(H, p, speed, V0, step, block = min(1024, len(hours)))
+				slope = PhasorSeries(H, p, speed, V0, step, block = min(1024, len(hours)))
+			for i in partitions:
+				t_i = index[i]
+				if not len(t_i):
+					continue
+				j = min(numbers[i], len(anchors) - 2)
+				if not step or j in jumped:
+					u, f = Tide._node_factors(anchors, F, t_i, jumps)
+					if derivatives:
+						out[:, index.positions(i)] = Tide._tidal_derivatives(t_i, H, p, speed, u, f, V0, derivatives)
+					else:
+						out[0, index.positions(i)] = Tide._tidal_series(t_i, H, p, speed, u, f, V0)
+					continue
+				#Between anchors j and j+1 the heights are the series with node
+				#factors F[j], plus w times the series with F[j+1] - F[j], where w
+				#runs from 0 to 1; both are evaluated by phasor rotation.
+				F_j, dF = sign[:, j] * F[:, j], sign[:, j] * (F[:, j + 1] - F[:, j])
+				series.seek(t_i[0], np.angle(F_j), np.abs(F_j))
+				slope.seek(t_i[0], np.angle(dF), np.abs(dF))
+				w = (t_i - anchors[j]) / spacing
+				if not derivatives:
+					out[0, index.positions(i)] = series.next(len(t_i)) + w * slope.next(len(t_i))
+					continue
+				#Since w is linear, the kth derivative of w times the slope
+				#series is w S^(k) + k S^(k-1) / spacing
+				S = slope.next_derivatives(len(t_i), derivatives)
+				values = series.next_derivatives(len(t_i), derivatives) + w * S
+				values[1:] += np.arange(1, derivatives + 1)[:, np.newaxis] * S[:-1] / spacing
+				out[:, index.positions(i)] = values
+
+		with instrument.stage('at.evaluate', len(hours) * len(H)):
+			Tide._threaded(evaluate, list(range(len(index))), workers)
+		return out
+
+	def stream(self, start, step, end = None, chunk = 1024):
+		"""
+		Generator yielding blocks of predictions on a uniform time grid, as
+		tuples (times, heights) of a datetime64 array and an array of heights.
+		Every block holds chunk predictions except possibly the last.
+		Arguments:
+		start -- time (datetime, datetime64 or seconds since the unix epoch) of the first prediction
+		step -- hours (or a timedelta) between predictions
+		end -- optional time before which predictions are made (if not given, the generator is infinite)
+		chunk -- number of predictions per block (default: 1024)
+		"""
+		start = Tide._as_times(start)
+		if end is not None:
+			end = Tide._as_times(end)
+		if isinstance(step, timedelta):
+			step = step.total_seconds() / 3600.0
+		step = float(step)
+		if not step > 0:
+			raise ValueError("step must be positive.")
+		total = None
+		if end is not None:
+			total = int(np.ceil(Tide._hours(start, end) / step))
+
+		#Node factors are prepared a few partitions at a time, and only for the
+		#partitions still to come, so memory use doesn't grow with the stream.
+		partition = 240.0
+		batch = 8
+		node = {}
+		def prepare(k):
+			times = Tide._times(start, [(j + 0.5)*partition for j in range(k, k + batch)])
+			speed, u, f, V0 = self.prepare(start, times, radians = True)
+			for j in list(node):
+				if j < k:
+					del node[j]
+			node.update(zip(range(k, k + batch), zip(u, f)))
+			return speed, V0
+
+		speed, V0 = prepare(0)
+		H = self.model['amplitude'][:, np.newaxis]
+		p = d2r*self.model['phase'][:, np.newaxis]
+		series = PhasorSeries(H, p, speed, V0, step, block = min(chunk, 1024))
+		t0 = Tide._datetime64(start)
+		i = 0
+		while total is None or i < total:
+			m = chunk if total is None else min(chunk, total - i)
+			index = i + np.arange(m)
+			hours = index * step
+			heights = np.empty(m)
+			#Split the block where it crosses partition boundaries
+			k = np.floor(hours / partition).astype(int)
+			edges = np.flatnonzero(np.diff(k)) + 1
+			for a, b in izip(np.append(0, edges), np.append(edges, m)):
+				if k[a] not in node:
+					prepare(k[a])
+				u, f = node[k[a]]
+				series.seek(hours[a], u, f)
+				series.next(b - a, heights[a:b])
+			times = t0 + np.round(hours * 3.6e9).astype('int64').astype('timedelta64[us]')
+			yield times, heights
+			i += m
 
 	def highs(self, *args):
 		"""
@@ -164,8 +470,12 @@ class Tide(object):
 		t0 -- time after which extrema are sought
 		t1 -- optional time before which extrema are sought (if not given, the generator is infinite)
 		partition -- number of hours for which we consider the node factors to be constant (default: 2400.0)
+		Times of extrema are datetimes if t0 is a datetime, otherwise datetime64
+		(t0 and t1 may be datetimes, datetime64 or seconds since the unix epoch).
 		"""
-		if t1:
+		t0 = Tide._as_times(t0)
+		if t1 is not None:
+			t1 = Tide._as_times(t1)
 			#yield from in python 3.4
 			for e in takewhile(lambda t: t[0] < t1, self.extrema(t0)):
 				yield e
@@ -188,8 +498,12 @@ class Tide(object):
 			amplitude = self.model['amplitude'][:, np.newaxis]
 			phase     = d2r*self.model['phase'][:, np.newaxis]
 
+			#scipy is only imported when first needed, so that predicting with
+			#stored models doesn't pay for it
+			from scipy.optimize import fsolve
 			for start, end in izip(*partitions):
-				speed, [u], [f], V0 = self.prepare(start, Tide._times(start, 0.5*partition))
+				with instrument.stage('extrema.prepare', 1):
+					speed, [u], [f], V0 = self.prepare(start, Tide._times(start, 0.5*partition))
 				#These derivatives don't include the time dependence of u or f,
 				#but these change slowly.
 				def d(t):
@@ -203,13 +517,91 @@ class Tide(object):
 				)
 				for a, b in izip(*intervals):
 					if d(a)*d(b) < 0:
-						extrema = fsolve(d, (a + b) / 2.0, fprime = d2)[0]
+						with instrument.stage('extrema.solve', 1):
+							extrema = fsolve(d, (a + b) / 2.0, fprime = d2)[0]
 						time = Tide._times(start, extrema)
 						[height] = self.at([time])
 						hilo = 'H' if d2(extrema) < 0 else 'L'
 						if start < time < end:
 							yield (time, height, hilo)
 
+	def extrema_array(self, t0, t1, partition = 2400.0, tolerance = 1e-9):
+		"""
+		Return the high and low tides between two times as arrays.
+		Arguments:
+		t0 -- time after which extrema are sought
+		t1 -- time before which extrema are sought
+		partition -- number of hours for which we consider the node factors to be constant (default: 2400.0)
+		tolerance -- hours to which the times of extrema are refined (default: 1e-9)
+		Returns (times, heights, hilo) where hilo holds 'H' for high tides and
+		'L' for low tides. Times are datetimes if t0 is a datetime, otherwise
+		datetime64 (t0 and t1 may be datetimes, datetime64 or seconds since the
+		unix epoch).
+		"""
+		t0, t1 = Tide._as_times(t0), Tide._as_times(t1)
+		span = Tide._hours(t0, t1)
+		count = max(int(np.ceil(span / partition)), 1)
+		with instrument.stage('extrema_array.prepare', count):
+			speed, u, f, V0 = self.prepare(
+				t0, Tide._times(t0, [(k + 0.5)*partition for k in range(count)]), radians = True
+			)
+		amplitude = self.model['amplitude'][:, np.newaxis]
+		phase     = d2r*self.model['phase'][:, np.newaxis]
+
+		hours, d2 = [np.zeros(0)], [np.zeros(0)]
+		if np.all(speed == 0) or not span > 0:
+			count = 0
+		else:
+			#We assume that extrema are separated by at least delta hours
+			delta = np.amin(0.5*np.pi / speed[speed != 0])
+
+		for k, u_k, f_k in izip(range(count), u, f):
+			#These derivatives don't include the time dependence of u or f,
+			#but these change slowly.
+			def derivatives(t):
+				argument = speed*t + (V0 + u_k) - phase
+				return (
+					np.sum(-speed*amplitude*f_k*np.sin(argument), axis=0),
+					np.sum(-speed**2.0 * amplitude*f_k*np.cos(argument), axis=0)
+				)
+
+			#Bracket the stationary points by sign changes on a dense grid, with
+			#several points per delta so that close pairs aren't missed.
+			lo, hi = k*partition, min((k + 1)*partition, span)
+			grid = np.linspace(lo, hi, int(np.ceil(4*(hi - lo) / delta)) + 1)
+			with instrument.stage('extrema_array.bracket', len(grid) * len(speed)):
+				d = np.sum(-speed*amplitude*f_k*np.sin(speed*grid + (V0 + u_k) - phase), axis=0)
+				i = np.flatnonzero(d[:-1]*d[1:] < 0)
+			a, b, da = grid[i], grid[i+1], d[i]
+
+			#Refine all of them together by Newton's method, falling back to
+			#bisection whenever a step would leave its bracket.
+			with instrument.stage('extrema_array.refine', len(a)):
+				x = 0.5*(a + b)
+				active = np.arange(len(x))
+				for _ in range(100):
+					if not len(active):
+						break
+					x_i, a_i, b_i = x[active], a[active], b[active]
+					d, d2_i = derivatives(x_i)
+					left = np.sign(d) == np.sign(da[active])
+					a_i, b_i = np.where(left, x_i, a_i), np.where(left, b_i, x_i)
+					newton = x_i - d/np.where(d2_i == 0, np.inf, d2_i)
+					inside = (a_i <= newton) & (newton <= b_i)
+					x[active] = np.where(inside, newton, 0.5*(a_i + b_i))
+					a[active], b[active] = a_i, b_i
+					active = active[np.abs(x[active] - x_i) >= tolerance]
+			hours.append(x)
+			d2.append(derivatives(x)[1])
+
+		hours, d2 = np.concatenate(hours), np.concatenate(d2)
+		hilo = np.where(d2 < 0, 'H', 'L')
+		times = Tide._times(t0, hours)
+		#Heights are evaluated together, and consistently with Tide.at
+		with instrument.stage('extrema_array.heights', len(times)):
+			heights = self.at(times) if len(times) else np.zeros(0)
+		return times, heights, hilo
+
 	@staticmethod
 	def _hours(t0, t):
 		"""
@@ -220,8 +612,10 @@ class Tide(object):
 		"""
 		if not isinstance(t, Iterable):
 			return Tide._hours(t0, [t])[0]
-		elif isinstance(t[0], datetime):
+		elif isinstance(t[0], datetime) and isinstance(t0, datetime):
 			return np.array([(ti-t0).total_seconds() / 3600.0 for ti in t])
+		elif Tide._is_time(t):
+			return (Tide._datetime64(t) - Tide._datetime64(t0)) / np.timedelta64(1, 'h')
 		else:
 			return t
 
@@ -232,31 +626,138 @@ class Tide(object):
 		Arguments:
 		hours -- sorted ndarray of hours.
 		partition -- maximum partition length (default: 3600.0)
+		See PartitionIndex for partitioning without copying or sorting.
+		"""
+		return list(PartitionIndex(hours, partition))
+
+	@staticmethod
+	def _uniform_step(hours, tolerance = 1e-9):
+		"""
+		Return the spacing of an array of uniformly spaced, increasing hours, or
+		None if they are not (within tolerance) uniformly spaced.
+		Arguments:
+		hours -- ndarray of hours
+		tolerance -- maximum deviation in hours from a uniform grid (default: 1e-9)
 		"""
-		partition = float(partition)
-		relative = hours - hours[0]
-		total_partitions = np.ceil(relative[-1] / partition + 10*np.finfo(np.float).eps).astype('int')
-		return [hours[np.floor(np.divide(relative, partition)) == i] for i in range(total_partitions)]
+		if len(hours) < 3:
+			return None
+		step = (hours[-1] - hours[0]) / (len(hours) - 1.0)
+		grid = hours[0] + step * np.arange(len(hours))
+		if step > 0 and np.all(np.abs(hours - grid) <= tolerance):
+			return step
+		return None
 
 	@staticmethod
 	def _times(t0, hours):
 		"""
-		Return a (list of) datetime(s) given an initial time and an (list of) hourly offset(s).
+		Return a (list of) time(s) given an initial time and an (list of) hourly offset(s).
+		The times are datetimes if t0 is a datetime, otherwise datetime64.
 		Arguments:
 		t0 -- initial time
 		hours -- hourly offsets from t0
 		"""
 		if not isinstance(hours, Iterable):
 			return Tide._times(t0, [hours])[0]
-		elif not isinstance(hours[0], datetime):
-			return np.array([t0 + timedelta(hours=h) for h in hours])
+		elif not Tide._is_time(hours):
+			offsets = np.round(np.asarray(hours, dtype=float) * 3.6e9).astype('int64')
+			times = Tide._datetime64(t0) + offsets.astype('timedelta64[us]')
+			if isinstance(t0, datetime):
+				return times.astype(object)
+			return times
 		else:
 			return np.array(hours)
 
+	@staticmethod
+	def _is_time(t):
+		"""
+		Return whether t is (or is a list of) datetime or datetime64 values,
+		rather than numbers.
+		"""
+		if isinstance(t, (list, tuple, np.ndarray)) and np.ndim(t) and len(t):
+			t = t[0]
+		return isinstance(t, (datetime, np.datetime64))
+
+	@staticmethod
+	def _as_times(t):
+		"""
+		Return t unchanged if it is (or is a list of) datetime or datetime64
+		values, otherwise interpret it as seconds since the unix epoch and
+		return the corresponding datetime64 value(s).
+		"""
+		if Tide._is_time(t):
+			return t
+		return Tide._datetime64(t)
+
+	@staticmethod
+	def _datetime64(t):
+		"""
+		Return a (list of) time(s) as datetime64[us].
+		Arguments:
+		t -- datetime(s), datetime64 value(s) or seconds since the unix epoch
+		"""
+		t = np.asarray(t)
+		if np.issubdtype(t.dtype, np.datetime64) or t.dtype == object:
+			return t.astype('datetime64[us]')[()]
+		seconds = np.round(t.astype(float) * 1e6).astype('int64').astype('timedelta64[us]')
+		return (np.datetime64('1970-01-01T00:00:00', 'us') + seconds)[()]
+
 	@staticmethod
 	def _tidal_series(t, amplitude, phase, speed, u, f, V0):
 		return np.sum(amplitude*f*np.cos(speed*t + (V0 + u) - phase), axis=0)
 
+	@staticmethod
+	def _tidal_derivatives(t, amplitude, phase, speed, u, f, V0, order):
+		"""
+		Return the tidal series and its first order time derivatives (per hour)
+		as an array of shape (order+1, len(t)), evaluating the cosine and sine
+		of each argument only once. As in extrema, the time dependence of u
+		and f is neglected.
+		"""
+		argument = speed*t + (V0 + u) - phase
+		cos, sin = np.cos(argument), np.sin(argument)
+		out = np.empty((order + 1, np.size(t)))
+		scale = amplitude*f
+		for k in range(order + 1):
+			#The kth derivative of cos(x) is speed^k cos(x + k pi/2)
+			sign, term = [(1, cos), (-1, sin), (-1, cos), (1, sin)][k % 4]
+			out[k] = sign*np.sum(scale*term, axis=0)
+			scale = scale*speed
+		return out
+
+	@staticmethod
+	def _design(t, speed, u, f, V0):
+		"""
+		Return the (2n, N) design matrix of the tidal series, whose rows are
+		f*cos(speed*t + V0 + u) followed by f*sin(speed*t + V0 + u), so that
+		_tidal_series is its product with (H cos p, H sin p).
+		"""
+		argument = speed*t + (V0 + u)
+		return np.append(f*np.cos(argument), f*np.sin(argument), axis=0)
+
+	def numeric(self):
+		"""
+		Return the model as an array of Tide.numeric_dtype.
+		"""
+		model = np.zeros(len(self.model), dtype=Tide.numeric_dtype)
+		model['constituent'] = [constituent.identify(c) for c in self.model['constituent']]
+		model['amplitude'] = self.model['amplitude']
+		model['phase'] = self.model['phase']
+		return model
+
+	@classmethod
+	def from_numeric(cls, model, table = None):
+		"""
+		Return a Tide from a model of Tide.numeric_dtype (see Tide.numeric()).
+		Arguments:
+		model -- array of Tide.numeric_dtype, with phases in degrees
+		table -- optional NodalTable for the Tide to use
+		"""
+		tide = np.zeros(len(model), dtype=cls.dtype)
+		tide['constituent'] = [constituent.registry[i] for i in model['constituent']]
+		tide['amplitude'] = model['amplitude']
+		tide['phase'] = model['phase']
+		return cls(model = tide, table = table)
+
 	def normalize(self):
 		"""
 		Adapt self.model so that amplitudes are positive and phases are in [0,360) as per convention
@@ -278,62 +779,68 @@ class Tide(object):
 			initial      = None,
 			n_period     = 2,
 			callback     = None,
-			full_output  = False
+			full_output  = False,
+			method       = 'leastsq',
+			chunk        = None,
+			table        = None,
+			node_tolerance = None
 		):
 		"""
 		Return an instance of Tide which has been fitted to a series of tidal observations.
 		Arguments:
 		It is not necessary to provide t0 or interval if t is provided.
-		heights -- ndarray of tidal observation heights
-		t -- ndarray of tidal observation times
+		heights -- array of tidal observation heights, or an iterator (such as a
+		           generator) or list of (times, heights) chunks where times are
+		           as for t
+		t -- ndarray of tidal observation times, as datetimes or datetime64, or
+		     as hours since t0 if t0 is given and otherwise seconds since the
+		     unix epoch
 		t0 -- datetime representing the time at which heights[0] was recorded
 		interval -- hourly interval between readings
 		constituents -- list of constituents to use in the fit (default: constituent.noaa)
-		initial -- optional Tide instance to use as first guess for least squares solver
+		initial -- optional Tide instance to use as first guess for least squares solver (leastsq only)
 		n_period -- only include constituents which complete at least this many periods (default: 2)
-		callback -- optional function to be called at each iteration of the solver
+		callback -- optional function to be called at each iteration of the solver (leastsq only)
 		full_output -- whether to return the output of scipy's leastsq solver (default: False)
+		method -- 'leastsq' to fit amplitudes and phases with scipy's nonlinear
+		          leastsq, or 'linear' to solve directly for the cosine and sine
+		          coefficients in one pass over the data (default: 'leastsq').
+		          With full_output the linear method returns a tuple in the
+		          style of leastsq's, (x, cov_x, infodict, mesg, ier), where
+		          cov_x is the unscaled covariance of (amplitudes, phases).
+		chunk -- if given, or if heights is a memmap, process the observations
+		         this many at a time (default for memmaps: 65536)
+		Chunked input (chunks, a memmap or a chunk size) must be fitted with
+		method = 'linear', which accumulates the normal equations chunk by chunk
+		so that memory use depends on the chunk size only.
+		table -- optional NodalTable to use for node factors; the fitted Tide will also use it
+		node_tolerance -- if given, interpolate the node factors between anchors
+		                  spaced as widely as this tolerance allows (see
+		                  Tide._node_anchors) rather than hold them constant
+		                  over 240 hour partitions (not for chunked input)
 		"""
-		if t is not None:
-			if isinstance(t[0], datetime):
-				hours = Tide._hours(t[0], t)
-				t0 = t[0]
-			elif t0 is not None:
-				hours = t
-			else:
-				raise ValueError("t can be an array of datetimes, or an array "
-				                 "of hours since t0 in which case t0 must be "
-				                 "specified.")
-		elif None not in [t0, interval]:
-			hours = np.arange(len(heights)) * interval
-		else:
-			raise ValueError("Must provide t(datetimes), or t(hours) and "
-			                 "t0(datetime), or interval(hours) and t0(datetime) "
-			                 "so that each height can be identified with an "
-			                 "instant in time.")
+		if method not in ('leastsq', 'linear'):
+			raise ValueError("method must be 'leastsq' or 'linear'.")
+		if Tide._is_chunks(heights) or isinstance(heights, np.memmap) or chunk:
+			if method != 'linear':
+				raise ValueError("Chunked input must be fitted with method = 'linear'.")
+			for name, value in [('initial', initial), ('callback', callback), ('node_tolerance', node_tolerance)]:
+				if value is not None:
+					raise ValueError("%s is not supported for chunked input." % name)
+			if not Tide._is_chunks(heights):
+				heights = Tide._chunks(heights, t, t0, interval, chunk or 65536)
+			return cls._decompose_chunks(heights, t0, constituents, n_period, full_output, table)
+		heights = np.asarray(heights, dtype=float)
+		t0, hours = Tide._observation_hours(len(heights), t, t0, interval)
 
-		#Remove duplicate constituents (those which travel at exactly the same
-		#speed, irrespective of phase)
-		constituents = list(OrderedDict.fromkeys(constituents))
+		constituents = Tide._select_constituents(constituents, t0, np.ptp(hours), n_period)
+		n = len(constituents)
 
 		#No need for least squares to find the mean water level constituent z0,
 		#work relative to mean
-		constituents = [c for c in constituents if not c == constituent._Z0]
 		z0 = np.mean(heights)
 		heights = heights - z0
 
-		#Only analyse frequencies which complete at least n_period cycles over
-		#the data period.
-		constituents = [
-			c for c in constituents
-			if 360.0 * n_period < hours[-1] * c.speed(astro(t0))
-		]
-		n = len(constituents)
-
-		sort = np.argsort(hours)
-		hours = hours[sort]
-		heights = heights[sort]
-
 		#We partition our time/height data into intervals over which we consider
 		#the values of u and f to assume a constant value (that is, their true
 		#value at the midpoint of the interval).  Constituent
@@ -341,20 +848,38 @@ class Tide(object):
 		#consider these constant and equal to their speed at t0, regardless of
 		#the length of the time series.
 
-		partition = 240.0
+		if node_tolerance is None:
+			partition = 240.0
+		else:
+			#Node factors are interpolated between anchors instead, so we
+			#partition between anchors, which may be months apart.
+			with instrument.stage('decompose.anchors'):
+				speed, V0, anchors, F, jumps = Tide._node_anchors(
+					constituents, t0, np.amin(hours), np.amax(hours), node_tolerance, table
+				)
+			partition = anchors[1] - anchors[0]
 
-		t     = Tide._partition(hours, partition)
-		times = Tide._times(t0, [(i + 0.5)*partition for i in range(len(t))])
+		with instrument.stage('decompose.partition', len(hours)):
+			index   = PartitionIndex(hours, partition)
+			hours   = index.hours
+			heights = index.sort(heights)
+			t       = list(index)
 
-		speed, u, f, V0 = Tide._prepare(constituents, t0, times, radians = True)
+		with instrument.stage('decompose.prepare', len(t)):
+			if node_tolerance is None:
+				times = Tide._times(t0, index.midpoints())
+				speed, u, f, V0 = Tide._prepare(constituents, t0, times, radians = True, table = table)
+			else:
+				u, f = zip(*[Tide._node_factors(anchors, F, t_i, jumps) for t_i in t])
 
 		#Residual to be minimised by variation of parameters (amplitudes, phases)
 		def residual(hp):
 			H, p = hp[:n, np.newaxis], hp[n:, np.newaxis]
-			s = np.concatenate([
-				Tide._tidal_series(t_i, H, p, speed, u_i, f_i, V0)
-				for t_i, u_i, f_i in izip(t, u, f)
-			])
+			with instrument.stage('decompose.residual', n * len(heights)):
+				s = np.concatenate([
+					Tide._tidal_series(t_i, H, p, speed, u_i, f_i, V0)
+					for t_i, u_i, f_i in izip(t, u, f)
+				])
 			res = heights - s
 			if callback:
 				callback(res)
@@ -365,17 +890,18 @@ class Tide(object):
 		#measurements / constituents.
 		def D_residual(hp):
 			H, p = hp[:n, np.newaxis], hp[n:, np.newaxis]
-			ds_dH = np.concatenate([
-				f_i*np.cos(speed*t_i+u_i+V0-p)
-				for t_i, u_i, f_i in izip(t, u, f)],
-				axis = 1)
+			with instrument.stage('decompose.jacobian', 2 * n * len(heights)):
+				ds_dH = np.concatenate([
+					f_i*np.cos(speed*t_i+u_i+V0-p)
+					for t_i, u_i, f_i in izip(t, u, f)],
+					axis = 1)
 
-			ds_dp = np.concatenate([
-				H*f_i*np.sin(speed*t_i+u_i+V0-p)
-				for t_i, u_i, f_i in izip(t, u, f)],
-				axis = 1)
+				ds_dp = np.concatenate([
+					H*f_i*np.sin(speed*t_i+u_i+V0-p)
+					for t_i, u_i, f_i in izip(t, u, f)],
+					axis = 1)
 
-			return np.append(-ds_dH, -ds_dp, axis=0)
+				return np.append(-ds_dH, -ds_dp, axis=0)
 
 		#Initial guess for solver, haven't done any analysis on this since the
 		#solver seems to converge well regardless of the initial guess We do
@@ -393,7 +919,36 @@ class Tide(object):
 
 		initial = np.append(amplitudes, phases)
 
-		lsq = leastsq(residual, initial, Dfun=D_residual, col_deriv=True, ftol=1e-7)
+		if method == 'leastsq':
+			#As in extrema, scipy is imported on first use
+			from scipy.optimize import leastsq
+
+		if method == 'linear':
+			#With u, f and V0 fixed the problem is linear in the cosine and sine
+			#coefficients, so we solve the normal equations directly.
+			with instrument.stage('decompose.solve', len(heights)):
+				partition_heights = index.split(heights)
+				equations = NormalEquations(n)
+				for t_i, h_i, u_i, f_i in izip(t, partition_heights, u, f):
+					equations.add(Tide._design(t_i, speed, u_i, f_i, V0), h_i)
+				#The heights are relative to their mean, which is z0 as for
+				#leastsq, so no other constant is fitted
+				lsq = Tide._solve_linear(equations.solve(centre = False))
+			instrument.event('decompose.linear', rss = lsq[2]['rss'], rank = lsq[2]['rank'])
+		elif instrument.active():
+			#The solver's diagnostics are only asked for while instrumented, but
+			#we return the same as otherwise.
+			with instrument.stage('decompose.solve', len(heights)):
+				x, _, info, mesg, ier = leastsq(
+					residual, initial, Dfun=D_residual, col_deriv=True, ftol=1e-7, full_output=True
+				)
+			instrument.event(
+				'decompose.leastsq', nfev = info['nfev'], njev = info.get('njev'),
+				cost = float(np.dot(info['fvec'], info['fvec'])), ier = ier, mesg = mesg
+			)
+			lsq = (x, ier)
+		else:
+			lsq = leastsq(residual, initial, Dfun=D_residual, col_deriv=True, ftol=1e-7)
 
 		model = np.zeros(1+n, dtype=cls.dtype)
 		model[0] = (constituent._Z0, z0, 0)
@@ -402,5 +957,189 @@ class Tide(object):
 		model[1:]['phase'] = lsq[0][n:]
 
 		if full_output:
-			return cls(model = model, radians = True), lsq
-		return cls(model = model, radians = True)
+			return cls(model = model, radians = True, table = table), lsq
+		return cls(model = model, radians = True, table = table)
+
+	@staticmethod
+	def _select_constituents(constituents, t0, span, n_period):
+		"""
+		Return the constituents to fit to observations spanning a number of
+		hours from t0.
+		Arguments:
+		constituents -- list of constituents
+		t0 -- time at which speeds are evaluated
+		span -- hours spanned by the observations
+		n_period -- only include constituents which complete at least this many periods
+		"""
+		#Remove duplicate constituents (those which travel at exactly the same
+		#speed, irrespective of phase)
+		constituents = list(OrderedDict.fromkeys(constituents))
+
+		#No need for least squares to find the mean water level constituent z0
+		constituents = [c for c in constituents if not c == constituent._Z0]
+
+		#Only analyse frequencies which complete at least n_period cycles over
+		#the data period.
+		a0 = astro(t0)
+		return [
+			c for c in constituents
+			if 360.0 * n_period < span * c.speed(a0)
+		]
+
+	@staticmethod
+	def _solve_linear(solution, column = 0):
+		"""
+		Return the solution of normal equations for one series of heights as a
+		tuple in the style of scipy's leastsq (x, cov_x, infodict, mesg, ier)
+		where x holds the amplitudes followed by the phases (radians).
+		Arguments:
+		solution -- (c, cov, rss, rank) as returned by NormalEquations.solve()
+		column -- the series (default: 0)
+		"""
+		c, cov, rss, rank = solution
+		amplitudes, phases, cov = polar(c[:, column], cov)
+		return (
+			np.append(amplitudes, phases),
+			cov,
+			{'nfev': 1, 'rss': rss[column], 'rank': rank},
+			'Solved the linear least squares problem directly.',
+			1
+		)
+
+	@staticmethod
+	def _observation_hours(count, t, t0, interval):
+		"""
+		Return (t0, hours) identifying each of a series of observations with an
+		instant in time, as hours since t0.
+		Arguments:
+		count -- number of observations (needed only with t0 and interval)
+		see Tide.decompose() for the remaining arguments
+		"""
+		if t is not None:
+			if t0 is None:
+				t = Tide._as_times(t)
+			if Tide._is_time(t):
+				hours = Tide._hours(t[0], t)
+				t0 = t[0]
+			else:
+				hours = t
+		elif None not in [t0, interval, count]:
+			hours = np.arange(count) * interval
+		else:
+			raise ValueError("Must provide t(datetimes), or t(hours) and "
+			                 "t0(datetime), or interval(hours) and t0(datetime) "
+			                 "so that each height can be identified with an "
+			                 "instant in time.")
+		return t0, np.atleast_1d(np.asarray(hours, dtype=float))
+
+	@staticmethod
+	def _is_chunks(heights):
+		"""
+		Return whether heights are (times, heights) chunks rather than heights:
+		an iterator, or a list or tuple of tuples.
+		"""
+		if isinstance(heights, (list, tuple)):
+			return bool(len(heights)) and isinstance(heights[0], tuple)
+		return not isinstance(heights, np.ndarray) and iter(heights) is heights
+
+	@staticmethod
+	def _chunks(heights, t, t0, interval, chunk):
+		"""
+		Generator yielding (times, heights) chunks of an array of heights.
+		Arguments:
+		see Tide.decompose()
+		"""
+		if t is None and None in [t0, interval]:
+			raise ValueError("Must provide t(datetimes), or t(hours) and "
+			                 "t0(datetime), or interval(hours) and t0(datetime) "
+			                 "so that each height can be identified with an "
+			                 "instant in time.")
+		for i in range(0, len(heights), chunk):
+			j = min(i + chunk, len(heights))
+			if t is not None:
+				yield t[i:j], heights[i:j]
+			else:
+				yield np.arange(i, j) * interval, heights[i:j]
+
+	@classmethod
+	def _decompose_chunks(cls, chunks, t0, constituents, n_period, full_output, table = None):
+		"""
+		Return an instance of Tide fitted to chunks of tidal observations by
+		accumulating the normal equations of the linear method chunk by chunk.
+		Arguments:
+		chunks -- iterable of (times, heights) where times are datetimes, datetime64,
+		          or numbers read as t is by Tide.decompose(): hours since t0 if
+		          t0 is given and otherwise seconds since the unix epoch
+		see Tide.decompose() for the remaining arguments
+		"""
+		epoch = t0 is None
+		constituents = [
+			c for c in OrderedDict.fromkeys(constituents)
+			if not c == constituent._Z0
+		]
+		constituents = constituent.ConstituentSet(constituents)
+		n = len(constituents)
+		partition = 240.0
+		equations = NormalEquations(n)
+		#Node factors of each partition (indexed from t0) seen so far
+		node = {}
+		first, last = np.inf, -np.inf
+
+		for times, heights in chunks:
+			if len(heights) == 0:
+				continue
+			if epoch:
+				times = Tide._as_times(times)
+			if t0 is None:
+				t0 = times[0]
+			hours = np.asarray(Tide._hours(t0, times), dtype=float)
+			first, last = min(first, np.amin(hours)), max(last, np.amax(hours))
+
+			with instrument.stage('decompose.partition', len(hours)):
+				index = PartitionIndex(hours, partition, origin = 0.0)
+				hours, heights = index.hours, index.sort(np.asarray(heights, dtype=float))
+			partitions = index.numbers()
+			new = [k for k, m in izip(partitions, index.counts()) if m and k not in node]
+			if new:
+				with instrument.stage('decompose.prepare', len(new)):
+					speed, u, f, V0 = Tide._prepare(
+						constituents, t0,
+						Tide._times(t0, [(k + 0.5)*partition for k in new]),
+						radians = True, table = table
+					)
+				node.update(zip(new, zip(u, f)))
+			with instrument.stage('decompose.accumulate', len(hours)):
+				for i, k in enumerate(partitions):
+					if index.counts()[i]:
+						u, f = node[k]
+						equations.add(
+							Tide._design(index.take(hours, i), speed, u, f, V0),
+							index.take(heights, i)
+						)
+
+		if not equations.count:
+			raise ValueError("No observations were provided.")
+
+		#Only analyse frequencies which complete at least n_period cycles over
+		#the data period.
+		keep = [
+			i for i, s in enumerate(r2d*speed[:, 0])
+			if 360.0 * n_period < (last - first) * s
+		]
+		with instrument.stage('decompose.solve', equations.count):
+			#The mean level isn't known until every chunk has been seen, so it
+			#is fitted together with the constituents
+			equations = equations.subset(keep)
+			solution = equations.solve(centre = True)
+			lsq = Tide._solve_linear(solution)
+		instrument.event('decompose.linear', rss = lsq[2]['rss'], rank = lsq[2]['rank'])
+
+		model = np.zeros(1+len(keep), dtype=cls.dtype)
+		model[0] = (constituent._Z0, equations.intercept(solution[0])[0], 0)
+		model[1:]['constituent'] = [constituents.constituents[i] for i in keep]
+		model[1:]['amplitude'] = lsq[0][:len(keep)]
+		model[1:]['phase'] = lsq[0][len(keep):]
+
+		if full_output:
+			return cls(model = model, radians = True, table = table), lsq
+		return cls(model = model, radians = True, table = table)
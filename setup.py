@@ -6,6 +6,6 @@ setup(name='pytides',
       author='Sam Cox',
       author_email='sam.cox@cantab.net',
       url='http://github.com/sam-cox/pytides',
-      packages=['pytides'],
+      packages=['pytides', 'pytides.benchmarks'],
       install_requires=['numpy>=1.8','scipy>=0.11'],
       license='MIT')
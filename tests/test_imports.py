@@ -0,0 +1,52 @@
+"""
+Checks that importing pytides stays within the import budget of
+pytides.benchmarks, and that predicting from stored models never imports
+scipy. Run with
+	python -m unittest discover tests
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from pytides import benchmarks
+from pytides.benchmarks.cases import model
+from pytides.store import ModelStore
+
+_predict_script = """
+import sys
+import numpy as np
+import pytides
+from pytides.store import ModelStore
+times = np.datetime64('2000-01-01T00:00', 'us') + np.arange(0, 720 * 3600 * 10**6, 600 * 10**6).astype('timedelta64[us]')
+heights = ModelStore.load(sys.argv[1])['station'].at(times)
+print('%r %r' % (len(heights), 'scipy' in sys.modules))
+"""
+
+class ImportTest(unittest.TestCase):
+
+	def test_budget(self):
+		result = benchmarks.imports()
+		self.assertEqual(result['exceeded'], [], result)
+
+	def test_prediction_without_scipy(self):
+		directory = tempfile.mkdtemp()
+		try:
+			path = os.path.join(directory, 'models.npz')
+			ModelStore.save(path, [model(0)], ['station'])
+			env = dict(os.environ)
+			env['PYTHONPATH'] = os.pathsep.join([root] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+			output = subprocess.check_output([sys.executable, '-c', _predict_script, path], env = env)
+		finally:
+			shutil.rmtree(directory)
+		count, scipy = output.decode().split()
+		self.assertEqual(int(count), 720 * 6)
+		self.assertEqual(scipy, 'False')
+
+if __name__ == '__main__':
+	unittest.main()